@@ -10,13 +10,16 @@
 import os
 import subprocess
 import time
+import weakref
 from collections import OrderedDict
+from itertools import groupby
 
 import addonHandler
 import api
 import braille
 import brailleInput
 import brailleTables
+import browseMode
 import config
 import controlTypes
 import globalCommands
@@ -37,13 +40,22 @@ from logHandler import log
 from . import addoncfg
 config.conf.spec["brailleExtender"] = addoncfg.getConfspec()
 from . import advancedinput
+from . import autoscroll
+from . import blink
+from . import displaylayout
 from . import huc
+from . import outline
 from . import patches
+from . import readahead
+from . import regionhelper
 from . import settings
 from . import tabledictionaries
+from . import textposition
+from . import textsender
 from . import undefinedchars
 from . import updatecheck
 from . import utils
+from . import virtualsettings
 from .common import addonName, addonURL, addonVersion, punctuationSeparator
 
 addonHandler.initTranslation()
@@ -87,10 +99,29 @@ rotorItems = [
 	("Table", _("Tables")),
 	("moveInTable", _("Move in table")),
 ]
+# Rotor items which don't need a browse mode document
+ROTOR_ITEMS_OUTSIDE_BROWSE_MODE = frozenset(["default", "moveInText", "textSelection", "object", "review", "moveInTable"])
+# Rotor items which use all the rotor gestures, the others don't select items nor move by set
+ROTOR_ITEMS_ALL_GESTURES = frozenset(["object", "review", "textSelection", "moveInText", "moveInTable"])
+ROTOR_SET_SCRIPTS = frozenset(["selectElt", "nextSetRotor", "priorSetRotor"])
+# Indexes of the rotor items available, depending on whether the focus is in a browse mode document
+rotorItemsByContext = {
+	False: [i for i, item in enumerate(rotorItems) if item[0] in ROTOR_ITEMS_OUTSIDE_BROWSE_MODE],
+	True: list(range(len(rotorItems))),
+}
+# Browse mode node types indexed for the rotor
+ROTOR_NODE_TYPES = [outline.getItemType(item[0]) for item in rotorItems if item[0] not in ROTOR_ITEMS_OUTSIDE_BROWSE_MODE]
+# Number of elements skipped by a rotor jump
+ROTOR_JUMP = 10
 rotorItem = 0
 rotorRange = 0
+rotorInBrowseMode = False
 lastRotorItemInVD = 0
 lastRotorItemInVDSaved = True
+# Delay after the second boundary before refreshing the clock (ms)
+HOUR_DATE_TICK_OFFSET = 20
+# Change of the adapted autoscroll rate (cells per minute)
+AUTOSCROLL_RATE_STEP = 20
 HLP_browseModeInfo = ". %s" % _("If pressed twice, presents the information in browse mode")
 
 # ***** Attribra code *****
@@ -98,49 +129,251 @@ def attribraEnabled():
 	if instanceGP and instanceGP.BRFMode: return False
 	return config.conf["brailleExtender"]["features"]["attributes"]
 
+# Typeforms used by attribra for each attribute choice
+TYPEFORMS = {
+	addoncfg.CHOICE_dot7: 7,
+	addoncfg.CHOICE_dot8: 8,
+	addoncfg.CHOICE_dots78: 78
+}
+DOTS_BY_TYPEFORM = {
+	7: 64,
+	8: 128,
+	78: 192
+}
+# Labels of the tags used when attributes are shown with tags instead of dots
+ATTRIBUTE_TAG_LABELS = {
+	"invalid-spelling": "err",
+	"bold": "b",
+	"italic": "i",
+	"underline": "u",
+	"strikethrough": "s",
+	"text-position:sub": "sub",
+	"text-position:super": "sup"
+}
+TAG_START = "[%s:"
+TAG_END = "]"
+# Markers used when only formatting changes are reported
+CHANGE_START = "["
+CHANGE_END = "]"
+CHANGE_ON = "+%s"
+CHANGE_OFF = "-%s"
+# Document formatting options needed to get each format field key
+FORMAT_CONFIG_OPTIONS = {
+	"invalid-spelling": ("reportSpellingErrors",),
+	"text-position": ("reportFontAttributes", "reportSuperscriptsAndSubscripts")
+}
+DEFAULT_FORMAT_CONFIG_OPTIONS = ("reportFontAttributes",)
+# (format field key, expected value) -> (priority, typeform)
+typeformLookup = {}
+# Format field keys with at least one marked attribute, in configuration order
+typeformFieldKeys = []
+# typeform bit -> (start tag, end tag), only filled when tags are enabled
+tagsByTypeform = {}
+# priority -> tag label, only filled when only formatting changes are reported
+changeLabels = {}
+# Document formatting options to enable when attributes are reported
+formatConfigOverrides = {}
+# (tables, tag) -> tag in Unicode braille
+_translatedTags = {}
+
+def attributeTagsEnabled():
+	return config.conf["brailleExtender"]["attributesTags"]
+
+def formattingChangesEnabled():
+	return config.conf["brailleExtender"]["formattingChanges"]
+
+def typeformsReplaced():
+	"""Returns whether tags or change markers are inserted in the regions instead of passing the typeforms to liblouis."""
+	return bool(tagsByTypeform or changeLabels) and attribraEnabled()
+
+def compileAttributes():
+	"""Compiles the attributes configuration into L{typeformLookup}.
+	Must be called after any change in config.conf["brailleExtender"]["attributes"].
+	"""
+	global typeformLookup, typeformFieldKeys, tagsByTypeform, changeLabels, formatConfigOverrides
+	lookup = {}
+	keys = []
+	tags = {}
+	labels = {}
+	overrides = {}
+	useChanges = formattingChangesEnabled()
+	useTags = attributeTagsEnabled() and not useChanges
+	for priority, attr in enumerate(ATTRS):
+		typeform = TYPEFORMS.get(config.conf["brailleExtender"]["attributes"][attr])
+		if not typeform: continue
+		if useChanges:
+			if attr not in ATTRIBUTE_TAG_LABELS: continue
+			labels[priority] = ATTRIBUTE_TAG_LABELS[attr]
+		elif useTags:
+			if attr not in ATTRIBUTE_TAG_LABELS: continue
+			# One typeform bit per attribute, they are not passed to liblouis in this mode
+			typeform = 1 << priority
+			tags[typeform] = (TAG_START % ATTRIBUTE_TAG_LABELS[attr], TAG_END)
+		v = attr.split(':')
+		k = v[0]
+		v = True if len(v) == 1 else v[1]
+		if k not in keys: keys.append(k)
+		for option in FORMAT_CONFIG_OPTIONS.get(k, DEFAULT_FORMAT_CONFIG_OPTIONS): overrides[option] = True
+		lookup.setdefault((k, v), (priority, typeform))
+		# '1' is accepted as a value for all attributes sharing this key
+		lookup.setdefault((k, '1'), (priority, typeform))
+	typeformLookup = lookup
+	typeformFieldKeys = keys
+	tagsByTypeform = tags
+	changeLabels = labels
+	formatConfigOverrides = overrides
+	_translatedTags.clear()
+
+def getChangeMarker(previous, state):
+	"""Returns the marker describing the transition between two sets of attribute priorities."""
+	marker = ''.join(CHANGE_ON % changeLabels[priority] for priority in sorted(state - previous))
+	marker += ''.join(CHANGE_OFF % changeLabels[priority] for priority in sorted(previous - state))
+	return CHANGE_START + marker + CHANGE_END
+
+def insertChangeMarkers(region):
+	"""Inserts the formatting change markers recorded while the region was built, in a single pass."""
+	tables = tuple(patches.getCurrentBrailleTables(brf=patches.instanceGP.BRFMode))
+	Repl = regionhelper.BrailleCellReplacement
+	size = len(region.rawText)
+	replacements = [
+		Repl(pos, insertBefore=getTranslatedTag(getChangeMarker(previous, state), tables))
+		for pos, previous, state in region.formatChanges if pos < size
+	]
+	if not replacements: return
+	regionhelper.replaceBrailleCells(region, replacements)
+	updateBrailleSelection(region)
+
+def updateBrailleSelection(region):
+	if region.brailleSelectionStart is None or region.selectionStart is None: return
+	rawToBraillePos = region.rawToBraillePos
+	region.brailleSelectionStart = rawToBraillePos[region.selectionStart]
+	region.brailleSelectionEnd = rawToBraillePos[region.selectionEnd] if region.selectionEnd < len(rawToBraillePos) else len(region.brailleCells)
+
+def getTranslatedTag(tag, tables):
+	"""Returns `tag` in Unicode braille, translated once per set of tables."""
+	key = (tables, tag)
+	translated = _translatedTags.get(key)
+	if translated is None:
+		translated = _translatedTags[key] = utils.getTextInBraille(tag, list(tables))
+	return translated
+
+def getTagChanges(typeforms):
+	"""Yields (position, end tags, start tags) where the set of attributes changes, in a single pass.
+	Each typeform holds one bit per attribute. Tags are kept nested: when an attribute ends,
+	the attributes opened inside it are closed as well, then opened again if they continue.
+	"""
+	opened = []
+	pos = 0
+	for start, end, typeform in getTypeformRuns(typeforms):
+		closed = next((i for i, bit in enumerate(opened) if not typeform & bit), len(opened))
+		reopened = [bit for bit in opened[closed:] if typeform & bit]
+		endTags = ''.join(tagsByTypeform[bit][1] for bit in reversed(opened[closed:]))
+		del opened[closed:]
+		opened += reopened + [bit for bit in tagsByTypeform if typeform & bit and bit not in opened and bit not in reopened]
+		startTags = ''.join(tagsByTypeform[bit][0] for bit in opened[closed:])
+		if endTags or startTags: yield start, endTags, startTags
+		pos = end
+	if opened: yield pos, ''.join(tagsByTypeform[bit][1] for bit in reversed(opened)), ''
+
+def insertAttributeTags(region):
+	"""Surrounds each run of marked text with the tags of its attributes, in a single pass over the region."""
+	tables = tuple(patches.getCurrentBrailleTables(brf=patches.instanceGP.BRFMode))
+	Repl = regionhelper.BrailleCellReplacement
+	replacements = {}
+	for pos, endTags, startTags in getTagChanges(region.rawTextTypeforms):
+		if endTags:
+			last = pos - 1
+			if last not in replacements: replacements[last] = Repl(last)
+			replacements[last].insertAfter = getTranslatedTag(endTags, tables)
+		if startTags:
+			if pos not in replacements: replacements[pos] = Repl(pos)
+			replacements[pos].insertBefore = getTranslatedTag(startTags, tables)
+	if not replacements: return
+	regionhelper.replaceBrailleCells(region, list(replacements.values()))
+	updateBrailleSelection(region)
+
+def getTypeformRuns(typeforms):
+	"""Yields a (start, end, typeform) tuple for each run of equal typeforms."""
+	start = 0
+	for typeform, group in groupby(typeforms):
+		end = start + sum(1 for _ in group)
+		yield start, end, typeform
+		start = end
+
+def getFormatConfig(formatConfig):
+	"""Returns the document formatting configuration used to build text regions."""
+	if attribraEnabled() and formatConfigOverrides:
+		formatConfig = formatConfig.copy()
+		formatConfig.update(formatConfigOverrides)
+	return formatConfig
+
+readahead.formatConfigFilter = getFormatConfig
+patches.typeformsReplaced = typeformsReplaced
+
 def decorator(fn, s):
 	def _getTypeformFromFormatField(self, field, formatConfig=None):
-		for attr in ATTRS:
-			v = attr.split(':')
-			k = v[0]
-			v = True if len(v) == 1 else v[1]
-			if k in field and (field[k] == v or field[k] == '1'):
-				if config.conf["brailleExtender"]["attributes"][attr] == addoncfg.CHOICE_dot7: return 7
-				if config.conf["brailleExtender"]["attributes"][attr] == addoncfg.CHOICE_dot8: return 8
-				if config.conf["brailleExtender"]["attributes"][attr] == addoncfg.CHOICE_dots78: return 78
-		# if COMPLCOLORS != None:
-			# col = field.get("color",False)
-			# if col and (col != COMPLCOLORS):
-				# return 4
-		return 0
+		res = None
+		state = set()
+		bits = 0
+		for k in typeformFieldKeys:
+			if k not in field: continue
+			try: match = typeformLookup.get((k, field[k]))
+			except TypeError: continue
+			if not match: continue
+			state.add(match[0])
+			bits |= match[1]
+			if not res or match[0] < res[0]: res = match
+		if changeLabels and hasattr(self, "formatChanges"):
+			# Only the transitions from the previous format field are reported
+			previous = getattr(self, "formatState", frozenset())
+			if state != previous:
+				pos = len(self.rawText)
+				changes = self.formatChanges
+				# Fields without text between them make a single transition
+				if changes and changes[-1][0] == pos:
+					previous = changes.pop()[1]
+				if state != previous: changes.append((pos, previous, frozenset(state)))
+				self.formatState = frozenset(state)
+			return 0
+		# Tag typeforms hold one bit per attribute, they are not meant for liblouis
+		if tagsByTypeform: return bits if attribraEnabled() else 0
+		return res[1] if res else 0
 
 	def addTextWithFields_edit(self, info, formatConfig, isSelection=False):
-		conf = formatConfig.copy()
-		if attribraEnabled():
-			conf["reportFontAttributes"] = True
-			conf["reportColor"] = True
-			conf["reportSpellingErrors"] = True
-			if logTextInfo: log.info(info.getTextWithFields(conf))
-		fn(self, info, conf, isSelection)
+		formatConfig = getFormatConfig(formatConfig)
+		if logTextInfo and attribraEnabled(): log.info(info.getTextWithFields(formatConfig))
+		fn(self, readahead.getTextInfo(info, formatConfig), formatConfig, isSelection)
 
 	def update(self):
+		self.formatState = frozenset()
+		self.formatChanges = []
 		fn(self)
+		self.attribraSpans = None
 		if not attribraEnabled(): return
-		DOT7 = 64
-		DOT8 = 128
-		size = len(self.rawTextTypeforms)
-		for i, j in enumerate(self.rawTextTypeforms):
-			try:
-				start = self.rawToBraillePos[i]
-				end = self.rawToBraillePos[i+1 if i+1 < size else (i if i<size else size-1)]
-			except IndexError as e:
-				log.debug(e)
-				return
-			k = start
-			for k in range(start, end):
-				if j == 78: self.brailleCells[k] |= DOT7 | DOT8
-				if j == 7: self.brailleCells[k] |= DOT7
-				if j == 8: self.brailleCells[k] |= DOT8
+		if changeLabels:
+			insertChangeMarkers(self)
+			return
+		if tagsByTypeform:
+			insertAttributeTags(self)
+			return
+		cells = self.brailleCells
+		rawToBraillePos = self.rawToBraillePos
+		size = len(rawToBraillePos)
+		spans = []
+		for start, end, typeform in getTypeformRuns(self.rawTextTypeforms):
+			if start >= size: break
+			mask = DOTS_BY_TYPEFORM.get(typeform)
+			if not mask: continue
+			brailleStart = rawToBraillePos[start]
+			brailleEnd = rawToBraillePos[end] if end < size else len(cells)
+			# Only the dots added here are removed when blinking
+			pos = brailleStart
+			for added, group in groupby(mask & ~cell for cell in cells[brailleStart:brailleEnd]):
+				spanEnd = pos + sum(1 for _ in group)
+				if added: spans.append((pos, spanEnd, added))
+				pos = spanEnd
+			cells[brailleStart:brailleEnd] = [cell | mask for cell in cells[brailleStart:brailleEnd]]
+		self.attribraSpans = spans
 
 	if s == "addTextWithFields": return addTextWithFields_edit
 	if s == "update": return update
@@ -148,6 +381,45 @@ def decorator(fn, s):
 # *************************
 
 
+class FocusState:
+	"""What focus changes need to know about the braille display, the profile and the document.
+	The display part is invalidated by display and profile switches, so the focus path only compares identities.
+	"""
+
+	def __init__(self):
+		self.display = None
+		self._treeInterceptor = None
+		self.isBrowseMode = False
+		self.isVirtualBuffer = False
+
+	def invalidate(self, *args, **kwargs):
+		self.display = None
+
+	def isDisplayCurrent(self):
+		return braille.handler.display is self.display
+
+	def _update(self, obj):
+		treeInterceptor = obj.treeInterceptor if obj is not None else None
+		if treeInterceptor is None:
+			self._treeInterceptor = None
+			self.isBrowseMode = self.isVirtualBuffer = False
+		elif not self._treeInterceptor or self._treeInterceptor() is not treeInterceptor:
+			self._treeInterceptor = weakref.ref(treeInterceptor)
+			self.isBrowseMode = isinstance(treeInterceptor, browseMode.BrowseModeTreeInterceptor)
+			self.isVirtualBuffer = isinstance(treeInterceptor, virtualBuffers.VirtualBuffer)
+
+	def inBrowseMode(self, obj):
+		self._update(obj)
+		return self.isBrowseMode
+
+	def inVirtualBuffer(self, obj):
+		self._update(obj)
+		return self.isVirtualBuffer
+
+
+focusState = FocusState()
+
+
 class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 	scriptCategory = addonName
 	brailleKeyboardLocked = False
@@ -158,11 +430,15 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 	modifiersLocked = False
 	hourDatePlayed = False
 	hourDateTimer = None
+	lastHourDate = None
 	autoScrollRunning = False
 	autoScrollTimer = None
 	modifiers = set()
 	_pGestures = OrderedDict()
 	rotorGES = {}
+	# Rotor gestures to bind for each class of rotor items ("default", "all" or "move")
+	rotorBindings = {}
+	boundRotorGES = {}
 	noKC = None
 	if not addoncfg.noUnicodeTable:
 		backupInputTable = brailleInput.handler.table
@@ -181,6 +457,13 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 		addoncfg.initGestures()
 		addoncfg.loadGestures()
 		self.gesturesInit()
+		patches.refreshGestureClassification()
+		compileAttributes()
+		blink.refresh()
+		config.post_configProfileSwitch.register(self.onConfigProfileSwitch)
+		if hasattr(braille, "displayChanged"):
+			braille.displayChanged.register(displaylayout.onDisplayChanged)
+			braille.displayChanged.register(focusState.invalidate)
 		checkingForced = False
 		if config.conf["brailleExtender"]["lastNVDAVersion"] != updatecheck.versionInfo.version:
 			config.conf["brailleExtender"]["lastNVDAVersion"] = updatecheck.versionInfo.version
@@ -201,9 +484,25 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 		advancedinput.initialize()
 		log.info(f"{addonName} {addonVersion} loaded ({round(time.time()-startTime, 2)}s)")
 
+	def event_textChange(self, obj, nextHandler):
+		textposition.invalidate(obj)
+		readahead.onTextChange(obj)
+		nextHandler()
+
+	def event_caret(self, obj, nextHandler):
+		readahead.onCaret(obj)
+		nextHandler()
+
+	def event_valueChange(self, obj, nextHandler):
+		textposition.invalidate(obj)
+		readahead.onTextChange(obj)
+		nextHandler()
+
 	def event_gainFocus(self, obj, nextHandler):
-		global rotorItem, lastRotorItemInVD, lastRotorItemInVDSaved
-		isVirtualBuff = obj is not None and isinstance(obj.treeInterceptor, virtualBuffers.VirtualBuffer)
+		global rotorItem, lastRotorItemInVD, lastRotorItemInVDSaved, rotorInBrowseMode
+		isVirtualBuff = rotorInBrowseMode = focusState.inBrowseMode(obj)
+		if outline.isEnabled() and focusState.inVirtualBuffer(obj) and obj.treeInterceptor.isReady:
+			outline.build(obj.treeInterceptor, ROTOR_NODE_TYPES)
 		if lastRotorItemInVDSaved and isVirtualBuff:
 			rotorItem = lastRotorItemInVD
 			self.bindRotorGES()
@@ -230,19 +529,38 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 				self.switchedMode = True
 			elif self.switchedMode and obj.role != controlTypes.ROLE_TERMINAL: self.restorReviewCursorTethering()
 
-		if "tabSize_%s" % addoncfg.curBD not in config.conf["brailleExtender"].copy().keys(): self.onReload(None, 1)
+		if braille.handler is not None and not focusState.isDisplayCurrent(): self.checkDisplayState()
 		if self.hourDatePlayed: self.script_hourDate(None)
 		if self.autoScrollRunning: self.script_autoScroll(None)
 		if self.autoTestPlayed: self.script_autoTest(None)
-		if braille.handler is not None and addoncfg.curBD != braille.handler.display.name:
-			addoncfg.curBD = braille.handler.display.name
-			self.onReload(None, 1)
+		if self.virtualSettings: self.script_virtualSettingsCancel(None)
 
 		if self.backup__brailleTableDict != config.conf["braille"]["translationTable"]: self.reloadBrailleTables()
 
 		nextHandler()
 		return
 
+	def checkDisplayState(self):
+		"""Reloads the add-on for a new braille display, or a profile without settings for the display."""
+		focusState.display = braille.handler.display
+		if addoncfg.curBD != braille.handler.display.name:
+			addoncfg.curBD = braille.handler.display.name
+			self.onReload(None, 1)
+		elif displaylayout.getDisplaySetting("tabSize", None) is None: self.onReload(None, 1)
+
+	@staticmethod
+	def onConfigProfileSwitch():
+		focusState.invalidate()
+		patches.refreshGestureClassification()
+		displaylayout.refresh()
+		compileAttributes()
+		blink.refresh()
+
+	@staticmethod
+	def onAttributesChange():
+		compileAttributes()
+		blink.refresh()
+
 	def createMenu(self):
 		self.submenu = wx.Menu()
 		item = self.submenu.Append(wx.ID_ANY, _("Docu&mentation"), _("Opens the addon's documentation."))
@@ -348,6 +666,14 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 			log.debug(self.rotorGES)
 		else:
 			log.debug("No rotor gestures for this profile")
+		self.rotorBindings = {
+			"default": {},
+			"all": {inputCore.normalizeGestureIdentifier(k): v for k, v in self.rotorGES.items()},
+		}
+		self.rotorBindings["move"] = {k: v for k, v in self.rotorBindings["all"].items() if v not in ROTOR_SET_SCRIPTS}
+		# Bindings were cleared on reload
+		self.boundRotorGES = {}
+		self.bindRotorGES()
 
 		# keyboard layout gestures
 		gK = OrderedDict()
@@ -389,33 +715,50 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 	def loadQuickLaunchesGes(self):
 		self.bindGestures({k: "quickLaunch" for k in config.conf["brailleExtender"]["quickLaunches"].copy().keys() if '(%s' % addoncfg.curBD in k})
 
+	@staticmethod
+	def getRotorItemClass():
+		name = rotorItems[rotorItem][0]
+		if name == "default": return "default"
+		return "all" if name in ROTOR_ITEMS_ALL_GESTURES else "move"
+
 	def bindRotorGES(self):
-		for k in self.rotorGES:
+		"""Binds the rotor gestures of the current rotor item, changing only those which differ from the bound ones."""
+		bindings = self.rotorBindings.get(self.getRotorItemClass(), {})
+		for k, v in self.boundRotorGES.items():
+			if bindings.get(k) == v: continue
 			try: self.removeGestureBinding(k)
-			except BaseException: pass
-		if rotorItems[rotorItem][0] == "default": return
-		if rotorItems[rotorItem][0] in ["object", "review", "textSelection", "moveInText", "moveInTable"]:
-			self.bindGestures(self.rotorGES)
-		else:
-			for k in self.rotorGES:
-				if self.rotorGES[k] not in ["selectElt", "nextSetRotor", "priorSetRotor"]:
-					self.bindGestures({k: self.rotorGES[k]})
+			except LookupError: pass
+		self.bindGestures({k: v for k, v in bindings.items() if self.boundRotorGES.get(k) != v})
+		self.boundRotorGES = bindings
 
-	def script_priorRotor(self, gesture):
+	def switchRotor(self, step):
 		global rotorItem
-		if rotorItem > 0:
-			rotorItem -= 1
-		else:
-			rotorItem = len(rotorItems) - 1
+		items = rotorItemsByContext[rotorInBrowseMode]
+		i = items.index(rotorItem) if rotorItem in items else 0
+		rotorItem = items[(i + step) % len(items)]
 		self.bindRotorGES()
+		outlineItems = self.getOutlineItems()
+		if outlineItems is not None:
+			return ui.message("%s (%d)" % (rotorItems[rotorItem][1], len(outlineItems)))
 		return ui.message(rotorItems[rotorItem][1])
+
+	@staticmethod
+	def getOutlineItems():
+		"""Returns the indexed elements of the current rotor item in the focused document, None if they are not indexed."""
+		if not rotorInBrowseMode or rotorItems[rotorItem][0] in ROTOR_ITEMS_OUTSIDE_BROWSE_MODE: return None
+		obj = api.getFocusObject()
+		items = outline.getItems(obj.treeInterceptor, outline.getItemType(rotorItems[rotorItem][0]))
+		# The document may not have been ready when it got the focus
+		if items is None and outline.isEnabled() and focusState.inVirtualBuffer(obj) and obj.treeInterceptor.isReady:
+			outline.build(obj.treeInterceptor, ROTOR_NODE_TYPES)
+		return items
+
+	def script_priorRotor(self, gesture):
+		return self.switchRotor(-1)
 	script_priorRotor.__doc__ = _("Switches to the previous rotor setting")
 
 	def script_nextRotor(self, gesture):
-		global rotorItem
-		rotorItem = 0 if rotorItem >= len(rotorItems) - 1 else rotorItem + 1
-		self.bindRotorGES()
-		return ui.message(rotorItems[rotorItem][1])
+		return self.switchRotor(1)
 	script_nextRotor.__doc__ = _("Switches to the next rotor setting")
 
 	@staticmethod
@@ -451,6 +794,7 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 		global rotorItem
 		obj = api.getFocusObject()
 		if obj.treeInterceptor is not None:
+			if outline.moveBy(obj.treeInterceptor, outline.getItemType(rotorItems[rotorItem][0]), 1 if direction == "next" else -1): return
 			func = getattr(obj.treeInterceptor, "script_%s%s" % (direction, rotorItems[rotorItem][0]), None)
 			if func: return func(gesture)
 		ui.message(_("Not available here"))
@@ -496,6 +840,25 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 		else: return self.moveTo("previous", gesture)
 	script_priorEltRotor.__doc__ = _("Moves to the previous item based on rotor setting")
 
+	def jumpRotor(self, count):
+		if self.getOutlineItems() is None: return ui.message(_("Not available here"))
+		if not outline.moveBy(api.getFocusObject().treeInterceptor, outline.getItemType(rotorItems[rotorItem][0]), count):
+			ui.message(_("No more items"))
+
+	def script_nextEltRotorJump(self, gesture):
+		self.jumpRotor(ROTOR_JUMP)
+	script_nextEltRotorJump.__doc__ = _("Moves %d items forward based on rotor setting") % ROTOR_JUMP
+
+	def script_priorEltRotorJump(self, gesture):
+		self.jumpRotor(-ROTOR_JUMP)
+	script_priorEltRotorJump.__doc__ = _("Moves %d items back based on rotor setting") % ROTOR_JUMP
+
+	def script_showRotorItems(self, gesture):
+		if self.getOutlineItems() is None: return ui.message(_("Not available here"))
+		if not outline.showNextItems(api.getFocusObject().treeInterceptor, outline.getItemType(rotorItems[rotorItem][0])):
+			ui.message(_("No more items"))
+	script_showRotorItems.__doc__ = _("Shows the next items of the rotor setting on the braille display, to select one of them with routing keys")
+
 	def script_nextSetRotor(self, gesture):
 		if rotorItems[rotorItem][0] in ["moveInText", "textSelection"]:
 			return self.switchSelectionRange()
@@ -574,6 +937,7 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 
 	def script_toggleAttribra(self, gesture):
 		config.conf["brailleExtender"]["features"]["attributes"] = not attribraEnabled()
+		blink.refresh()
 		utils.refreshBD()
 		if config.conf["brailleExtender"]["features"]["attributes"]:
 			speech.speakMessage("Attribra enabled")
@@ -581,6 +945,15 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 			speech.speakMessage("Attribra disabled")
 	script_toggleAttribra.__doc__ = _("Toggle font attributes report")
 
+	def script_toggleRightToLeft(self, gesture):
+		config.conf["brailleExtender"]["rightToLeft"] = not config.conf["brailleExtender"]["rightToLeft"]
+		displaylayout.refresh()
+		if config.conf["brailleExtender"]["rightToLeft"]:
+			speech.speakMessage(_("Reading from right to left"))
+		else:
+			speech.speakMessage(_("Reading from left to right"))
+	script_toggleRightToLeft.__doc__ = _("Toggle reading the braille display from right to left")
+
 	def script_toggleSpeechScrollFocusMode(self, gesture):
 		choices = addoncfg.focusOrReviewChoices
 		curChoice = config.conf["brailleExtender"]["speakScroll"]
@@ -648,6 +1021,7 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 		if self.advancedInput:
 			speech.speakMessage(_("Advanced braille input mode enabled"))
 		else:
+			advancedinput.clearCandidates()
 			speech.speakMessage(_("Advanced braille input mode disabled"))
 	script_advancedInput.__doc__ = _("Toggle advanced input mode")
 
@@ -661,7 +1035,16 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 	script_undefinedCharsDesc.__doc__ = _("Toggle description of undefined characters")
 
 	def script_position(self, gesture=None):
-		curpos, total = utils.getTextPosition()
+		position = textposition.getPosition(onExact=self.reportPosition)
+		if not position:
+			ui.message(_("Computing position…"))
+			return
+		curpos, total, exact = position
+		if exact: self.reportPosition(curpos, total)
+		else: ui.message(_("About {percentage}%").format(percentage=round(curpos / total * 100) if total else 0))
+
+	@staticmethod
+	def reportPosition(curpos, total):
 		if total:
 			percentage = round((curpos / total * 100), 2)
 			ui.message(f"{percentage}% ({curpos}/{total})")
@@ -670,7 +1053,7 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 	script_position.__doc__ = _("Reports the cursor position of text under the braille cursor")
 
 	def script_hourDate(self, gesture=None):
-		if self.autoScrollRunning:
+		if self.autoScrollRunning or self.virtualSettings:
 			return
 		if self.hourDatePlayed:
 			self.hourDateTimer.Stop()
@@ -682,34 +1065,44 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 				if addoncfg.noMessageTimeout:
 					self.backupMessageTimeout = config.conf["braille"]["noMessageTimeout"]
 					config.conf["braille"]["noMessageTimeout"] = True
+			self.lastHourDate = None
 			self.showHourDate()
 			if config.conf["brailleExtender"]["hourDynamic"]:
-				self.hourDateTimer = wx.PyTimer(self.showHourDate)
-				time.sleep(1.02 - round(time.time() - int(time.time()), 3))
-				self.showHourDate()
-				self.hourDateTimer.Start(1000)
+				self.hourDateTimer = wx.PyTimer(self.onHourDateTimer)
+				self.scheduleHourDate()
 			else:
 				return
 		self.hourDatePlayed = not self.hourDatePlayed
 		return
 	script_hourDate.__doc__ = _("Shows hour and date changes automatically on a braille display")
 
-	@staticmethod
-	def showHourDate():
+	def scheduleHourDate(self):
+		# Next tick just after the next second boundary, whatever the drift of the previous ones
+		delay = HOUR_DATE_TICK_OFFSET + 1000 - int(time.time() % 1 * 1000)
+		self.hourDateTimer.StartOnce(delay)
+
+	def onHourDateTimer(self):
+		if not self.hourDatePlayed: return
+		self.showHourDate()
+		self.scheduleHourDate()
+
+	def showHourDate(self):
 		currentHourDate = time.strftime('%X %x (%a, %W/53, %b)', time.localtime())
+		if currentHourDate == self.lastHourDate: return
+		self.lastHourDate = currentHourDate
 		return braille.handler.message(currentHourDate)
 
 	def script_autoScroll(self, gesture, sil=False):
 		if self.hourDatePlayed:
 			return
 		if self.autoScrollRunning:
-			self.autoScrollTimer.Stop()
+			self.autoScrollTimer.stop()
 			if not sil:
 				speech.speakMessage(_("Autoscroll stopped"))
 			config.conf["braille"]["showCursor"] = self.backupShowCursor
 		else:
-			self.autoScrollTimer = wx.PyTimer(self.autoScroll)
-			try: self.autoScrollTimer.Start(int(config.conf["brailleExtender"]["autoScrollDelay_%s" % addoncfg.curBD]))
+			self.autoScrollTimer = autoscroll.AutoScroll(onEnd=self.onAutoScrollEnd)
+			try: self.autoScrollTimer.start()
 			except BaseException as e:
 				log.error("%s | %s" % (config.conf["brailleExtender"]["autoScrollDelay_%s" % addoncfg.curBD], e))
 				ui.message(_("Unable to start autoscroll. More info in NVDA log"))
@@ -719,10 +1112,10 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 		self.autoScrollRunning = not self.autoScrollRunning
 	script_autoScroll.__doc__ = _("Toggle automatic braille scroll")
 
-	def autoScroll(self):
-		braille.handler.scrollForward()
-		if utils.isLastLine():
-			self.script_autoScroll(None)
+	def onAutoScrollEnd(self):
+		self.autoScrollRunning = False
+		speech.speakMessage(_("Autoscroll stopped"))
+		config.conf["braille"]["showCursor"] = self.backupShowCursor
 
 	def script_volumePlus(self, gesture):
 		keyboardHandler.KeyboardInputGesture.fromName('volumeup').send()
@@ -798,31 +1191,37 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 
 	@staticmethod
 	def increaseDelayAutoScroll():
+		if config.conf["brailleExtender"]["autoScrollAdaptive"]:
+			if config.conf["brailleExtender"]["autoScrollRate"] - AUTOSCROLL_RATE_STEP >= AUTOSCROLL_RATE_STEP:
+				config.conf["brailleExtender"]["autoScrollRate"] -= AUTOSCROLL_RATE_STEP
+			return
 		config.conf["brailleExtender"]["autoScrollDelay_%s" % addoncfg.curBD] += 25
 
 	@staticmethod
 	def decreaseDelayAutoScroll():
+		if config.conf["brailleExtender"]["autoScrollAdaptive"]:
+			config.conf["brailleExtender"]["autoScrollRate"] += AUTOSCROLL_RATE_STEP
+			return
 		if config.conf["brailleExtender"]["autoScrollDelay_%s" % addoncfg.curBD] - 25 >= 25:
 			config.conf["brailleExtender"]["autoScrollDelay_%s" % addoncfg.curBD] -= 25
 
+	@staticmethod
+	def reportDelayAutoScroll():
+		if config.conf["brailleExtender"]["autoScrollAdaptive"]:
+			# Translators: reported when the autoscroll reading rate changes.
+			ui.message(_("%d cells per minute") % config.conf["brailleExtender"]["autoScrollRate"])
+		else:
+			ui.message('%s ms' % config.conf["brailleExtender"]["autoScrollDelay_%s" % addoncfg.curBD])
+
 	def script_increaseDelayAutoScroll(self, gesture):
 		self.increaseDelayAutoScroll()
-		if self.autoScrollRunning:
-			self.script_autoScroll(None, True)
-			self.script_autoScroll(None)
-		else:
-			ui.message('%s ms' %
-					   config.conf["brailleExtender"]["autoScrollDelay_%s" % addoncfg.curBD])
-		return
+		if self.autoScrollRunning: self.autoScrollTimer.restart()
+		else: self.reportDelayAutoScroll()
 
 	def script_decreaseDelayAutoScroll(self, gesture):
 		self.decreaseDelayAutoScroll()
-		if self.autoScrollRunning:
-			self.script_autoScroll(None, True)
-			self.script_autoScroll(None)
-		else:
-			ui.message('%s ms' % config.conf["brailleExtender"]["autoScrollDelay_%s" % addoncfg.curBD])
-		return
+		if self.autoScrollRunning: self.autoScrollTimer.restart()
+		else: self.reportDelayAutoScroll()
 	script_increaseDelayAutoScroll.__doc__ = _("Increases braille autoscroll delay")
 	script_decreaseDelayAutoScroll.__doc__ = _("Decreases braille autoscroll delay")
 
@@ -898,6 +1297,8 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 		addoncfg.initGestures()
 		addoncfg.loadGestures()
 		self.gesturesInit()
+		patches.refreshGestureClassification()
+		compileAttributes()
 		if config.conf["brailleExtender"]["reverseScrollBtns"]:
 			self.reverseScrollBtns()
 		if not sil: ui.message(_("Braille Extender reloaded"))
@@ -1137,6 +1538,76 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 		else: ui.message(_("Buffer empty"))
 	script_showBrailleViewSaved.__doc__ = _("Shows the saved braille view through a flash message") + HLP_browseModeInfo
 
+	# section virtualSettings
+	virtualSettings = None
+	virtualSettings_gestures = {
+		"kb:escape": "virtualSettingsCancel",
+		"kb:enter": "virtualSettings",
+		"kb:uparrow": "virtualSettingsPrior",
+		"kb:downarrow": "virtualSettingsNext",
+		"kb:leftarrow": "virtualSettingsDecrease",
+		"kb:rightarrow": "virtualSettingsIncrease",
+		"kb:space": "virtualSettingsIncrease",
+	}
+
+	def showVirtualSettings(self, line):
+		braille.handler.message(line)
+		speech.speakMessage(line)
+
+	def closeVirtualSettings(self):
+		for k in self.virtualSettings_gestures:
+			try: self.removeGestureBinding(k)
+			except LookupError: pass
+		self.virtualSettings = None
+		self.clearMessageFlash()
+		if addoncfg.noMessageTimeout: config.conf["braille"]["noMessageTimeout"] = self.backupMessageTimeout
+
+	def script_virtualSettings(self, gesture):
+		if self.virtualSettings:
+			keys = self.virtualSettings.save()
+			self.closeVirtualSettings()
+			if keys:
+				self.onVirtualSettingsSave(keys)
+				utils.refreshBD()
+			speech.speakMessage(_("Virtual settings closed, %d options changed") % len(keys))
+			return
+		if self.autoTestPlayed or self.autoScrollRunning or self.hourDatePlayed: return
+		self.virtualSettings = virtualsettings.VirtualSettings()
+		if addoncfg.noMessageTimeout:
+			self.backupMessageTimeout = config.conf["braille"]["noMessageTimeout"]
+			config.conf["braille"]["noMessageTimeout"] = True
+		self.bindGestures(self.virtualSettings_gestures)
+		speech.speakMessage(_("Virtual settings. Use the up and down arrow keys to choose an option, the left and right arrow keys to change it. Use enter to save the changes or escape to discard them"))
+		braille.handler.message(self.virtualSettings.getLine())
+	script_virtualSettings.__doc__ = _("Changes Braille Extender settings from the braille display")
+
+	def onVirtualSettingsSave(self, keys):
+		"""Runs the actions of the settings dialogs for the options changed in virtual settings."""
+		if ("reverseScrollBtns",) in keys:
+			self.reverseScrollBtns(None, not config.conf["brailleExtender"]["reverseScrollBtns"])
+		if ("features", "roleLabels") in keys:
+			addoncfg.discardRoleLabels()
+			if config.conf["brailleExtender"]["features"]["roleLabels"]:
+				addoncfg.loadRoleLabels(config.conf["brailleExtender"]["roleLabels"].copy())
+		self.onConfigProfileSwitch()
+
+	def script_virtualSettingsCancel(self, gesture):
+		self.closeVirtualSettings()
+		speech.speakMessage(_("Virtual settings closed, changes discarded"))
+
+	def script_virtualSettingsPrior(self, gesture):
+		self.showVirtualSettings(self.virtualSettings.move(-1))
+
+	def script_virtualSettingsNext(self, gesture):
+		self.showVirtualSettings(self.virtualSettings.move(1))
+
+	def script_virtualSettingsDecrease(self, gesture):
+		self.showVirtualSettings(self.virtualSettings.change(-1))
+
+	def script_virtualSettingsIncrease(self, gesture):
+		self.showVirtualSettings(self.virtualSettings.change(1))
+	# end of section virtualSettings
+
 	# section autoTest
 	autoTestPlayed = False
 	autoTestTimer = None
@@ -1270,6 +1741,7 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 	__gestures["kb:nvda+windows+u"] = "undefinedCharsDesc"
 	__gestures["kb:nvda+windows+h"] = "toggleOneHandMode"
 	__gestures["kb:nvda+windows+k"] = "reloadAddon"
+	__gestures["kb:nvda+windows+s"] = "virtualSettings"
 	__gestures["kb:volumeMute"] = "toggleVolume"
 	__gestures["kb:volumeUp"] = "volumePlus"
 	__gestures["kb:volumeDown"] = "volumeMinus"
@@ -1280,6 +1752,10 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 	__gestures["kb:nvda+shift+j"] = "toggleAttribra"
 
 	def terminate(self):
+		config.post_configProfileSwitch.unregister(self.onConfigProfileSwitch)
+		if hasattr(braille, "displayChanged"):
+			braille.displayChanged.unregister(displaylayout.onDisplayChanged)
+			braille.displayChanged.unregister(focusState.invalidate)
 		braille.TextInfoRegion._addTextWithFields = self.backup__addTextWithFields
 		braille.TextInfoRegion.update = self.backup__update
 		braille.TextInfoRegion._getTypeformFromFormatField = self.backup__getTypeformFromFormatField
@@ -1293,11 +1769,17 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 			if addoncfg.noMessageTimeout:
 				config.conf["braille"]["noMessageTimeout"] = self.backupMessageTimeout
 		if self.autoScrollRunning:
-			self.autoScrollTimer.Stop()
+			self.autoScrollTimer.stop()
 			config.conf["braille"]["showCursor"] = self.backupShowCursor
 		if self.autoTestPlayed: self.autoTestTimer.Stop()
+		if self.virtualSettings: self.closeVirtualSettings()
 		tabledictionaries.removeTmpDict()
 		advancedinput.terminate()
+		outline.invalidate()
+		textsender.cancel()
+		braille.BrailleHandler._writeCells = patches.origFunc["_writeCells"]
+		blink.terminate()
+		displaylayout.terminate()
 		super().terminate()
 
 	def removeMenu(self):
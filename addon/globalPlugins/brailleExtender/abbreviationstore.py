@@ -0,0 +1,148 @@
+# abbreviationstore.py
+# Part of BrailleExtender addon for NVDA
+# Copyright 2016-2021 André-Abush CLAUSE, released under GPL.
+# Compact on-disk storage for the advanced input mode dictionary.
+#
+# File layout (little endian):
+#   header:  magic (4s), version (H), number of records (I)
+#   index:   one absolute offset (I) per record, in key order
+#   records: abbreviation length (H), replacement length (I), table length (H),
+#            followed by the three UTF-8 encoded strings
+# Records are sorted on the UTF-8 bytes of the abbreviation, so all the
+# abbreviations starting with a given prefix form a contiguous range.
+
+import mmap
+import os
+import struct
+
+MAGIC = b"BEAI"
+VERSION = 1
+HEADER = struct.Struct("<4sHI")
+OFFSET = struct.Struct("<I")
+RECORD = struct.Struct("<HIH")
+
+
+class InvalidStoreError(ValueError):
+	pass
+
+
+def compileEntries(entries):
+	"""Returns the binary representation of an iterable of (abbreviation, replaceBy, table) tuples."""
+	records = sorted(
+		(abreviation.encode("UTF-8"), table.encode("UTF-8"), replaceBy.encode("UTF-8"))
+		for abreviation, replaceBy, table in entries
+	)
+	offset = HEADER.size + OFFSET.size * len(records)
+	index = []
+	blocks = []
+	for abreviation, table, replaceBy in records:
+		index.append(OFFSET.pack(offset))
+		block = RECORD.pack(len(abreviation), len(replaceBy), len(table)) + abreviation + replaceBy + table
+		blocks.append(block)
+		offset += len(block)
+	return HEADER.pack(MAGIC, VERSION, len(records)) + b"".join(index) + b"".join(blocks)
+
+
+def write(path, entries):
+	"""Writes a store file atomically."""
+	tmpPath = path + ".tmp"
+	with open(tmpPath, "wb") as f:
+		f.write(compileEntries(entries))
+	os.replace(tmpPath, path)
+
+
+class AbbreviationStore:
+	"""Read-only view on a compiled dictionary, backed by bytes or by a memory-mapped file.
+	Records are only decoded when they are requested.
+	"""
+
+	def __init__(self, data=None, fileObj=None):
+		if not data: data = HEADER.pack(MAGIC, VERSION, 0)
+		magic, version, count = HEADER.unpack_from(data, 0)
+		if magic != MAGIC or version != VERSION:
+			raise InvalidStoreError("Unsupported abbreviation store (%r, %d)" % (magic, version))
+		self._data = data
+		self._file = fileObj
+		self._count = count
+
+	@classmethod
+	def open(cls, path):
+		fileObj = open(path, "rb")
+		try:
+			if not os.fstat(fileObj.fileno()).st_size:
+				fileObj.close()
+				return cls()
+			data = mmap.mmap(fileObj.fileno(), 0, access=mmap.ACCESS_READ)
+			return cls(data, fileObj)
+		except BaseException:
+			fileObj.close()
+			raise
+
+	@classmethod
+	def fromEntries(cls, entries):
+		return cls(compileEntries(entries))
+
+	def close(self):
+		if self._file:
+			self._data.close()
+			self._file.close()
+			self._file = None
+		self._data = HEADER.pack(MAGIC, VERSION, 0)
+		self._count = 0
+
+	def __len__(self):
+		return self._count
+
+	def __iter__(self):
+		for i in range(self._count):
+			yield self.entry(i)
+
+	def _offset(self, i):
+		return OFFSET.unpack_from(self._data, HEADER.size + OFFSET.size * i)[0]
+
+	def key(self, i):
+		"""Returns the UTF-8 encoded abbreviation of the record `i`."""
+		offset = self._offset(i)
+		size = RECORD.unpack_from(self._data, offset)[0]
+		start = offset + RECORD.size
+		return self._data[start:start + size]
+
+	def entry(self, i):
+		"""Returns the record `i` as an (abbreviation, replaceBy, table) tuple."""
+		offset = self._offset(i)
+		sizeAbreviation, sizeReplaceBy, sizeTable = RECORD.unpack_from(self._data, offset)
+		start = offset + RECORD.size
+		end = start + sizeAbreviation + sizeReplaceBy + sizeTable
+		raw = self._data[start:end]
+		return (
+			raw[:sizeAbreviation].decode("UTF-8"),
+			raw[sizeAbreviation:sizeAbreviation + sizeReplaceBy].decode("UTF-8"),
+			raw[sizeAbreviation + sizeReplaceBy:].decode("UTF-8")
+		)
+
+	def _bisect(self, key, right=False):
+		size = len(key)
+		lo, hi = 0, self._count
+		while lo < hi:
+			mid = (lo + hi) // 2
+			k = self.key(mid)
+			if right: k = k[:size]
+			if k < key or (right and k == key): lo = mid + 1
+			else: hi = mid
+		return lo
+
+	def prefixRange(self, prefix):
+		"""Returns the (start, end) range of the records whose abbreviation starts with `prefix`."""
+		key = prefix.encode("UTF-8")
+		return self._bisect(key), self._bisect(key, True)
+
+	def exactRange(self, abreviation):
+		"""Returns the (start, end) range of the records whose abbreviation is `abreviation`."""
+		key = abreviation.encode("UTF-8")
+		start = end = self._bisect(key)
+		while end < self._count and self.key(end) == key: end += 1
+		return start, end
+
+	def find(self, abreviation, strict=False):
+		start, end = self.exactRange(abreviation) if strict else self.prefixRange(abreviation)
+		return [self.entry(i) for i in range(start, end)]
@@ -12,6 +12,7 @@ import globalVars
 import inputCore
 from logHandler import log
 
+from . import displaylayout
 from .common import addonUpdateChannel, configDir, profilesDir
 from .onehand import DOT_BY_DOT, ONE_SIDE, BOTH_SIDES
 
@@ -64,7 +65,6 @@ focusOrReviewChoices = dict([
 ])
 
 curBD = braille.handler.display.name
-backupDisplaySize = braille.handler.displaySize
 backupRoleLabels = {}
 iniGestures = {}
 iniProfile = {}
@@ -119,11 +119,20 @@ def getConfspec():
 		"hourDynamic": "boolean(default=True)",
 		"leftMarginCells_%s" % curBD: "integer(min=0, default=0, max=80)",
 		"rightMarginCells_%s" % curBD: "integer(min=0, default=0, max=80)",
+		"deadCells_%s" % curBD: 'string(default="")',
+		"deadDots_%s" % curBD: 'string(default="")',
+		"deadDotsReplacements_%s" % curBD: 'string(default="")',
 		"reverseScrollBtns": "boolean(default=False)",
 		"autoScrollDelay_%s" % curBD: "integer(min=125, default=3000, max=42000)",
 		"smartDelayScroll": "boolean(default=False)",
 		"ignoreBlankLineScroll": "boolean(default=True)",
 		"skipBlankLinesScroll": "boolean(default=False)",
+		"skipBlankLinesMax": "integer(min=1, default=500, max=100000)",
+		"skipBlankLinesTimeout": "integer(min=10, default=250, max=5000)",
+		"readAheadUnits": "integer(min=0, default=3, max=20)",
+		"autoScrollAdaptive": "boolean(default=False)",
+		"autoScrollRate": "integer(min=20, default=600, max=6000)",
+		"outlineIndex": "boolean(default=False)",
 		"speakScroll": "option({CHOICE_none}, {CHOICE_focus}, {CHOICE_review}, {CHOICE_focusAndReview}, default={CHOICE_focusAndReview})".format(
 			CHOICE_none=CHOICE_none,
 			CHOICE_focus=CHOICE_focus,
@@ -156,6 +165,11 @@ def getConfspec():
 		"postTable": 'string(default="None")',
 		"viewSaved": "string(default=%s)" % NOVIEWSAVED,
 		"reviewModeTerminal": "boolean(default=True)",
+		"rightToLeft": "boolean(default=False)",
+		"attributesTags": "boolean(default=False)",
+		"formattingChanges": "boolean(default=False)",
+		"blinkAttributes": "boolean(default=False)",
+		"blinkAttributesRate": "integer(min=100, default=600, max=5000)",
 		"features": {
 			"attributes": "boolean(default=True)",
 			"roleLabels": "boolean(default=True)"
@@ -211,6 +225,9 @@ def getConfspec():
 		"advancedInputMode": {
 			"stopAfterOneChar": "boolean(default=True)",
 			"escapeSignUnicodeValue": "string(default=⠼)",
+			"showCandidates": "boolean(default=True)",
+			"maxCandidates": "integer(min=1, default=5, max=20)",
+			"sendRateLimit": "integer(min=0, default=0, max=10000)",
 		},
 		"oneHandedMode": {
 			"enabled": "boolean(default=False)",
@@ -275,10 +292,16 @@ def loadConf():
 		config.conf["brailleExtender"]["profile_%s" % curBD] = "default"
 	if "tabSize_%s" % curBD not in brlextConf.keys():
 		config.conf["brailleExtender"]["tabSize_%s" % curBD] = 2
-	if "leftMarginCells__%s" % curBD not in brlextConf.keys():
+	if "leftMarginCells_%s" % curBD not in brlextConf.keys():
 		config.conf["brailleExtender"]["leftMarginCells_%s" % curBD] = 0
 	if "rightMarginCells_%s" % curBD not in brlextConf.keys():
 		config.conf["brailleExtender"]["rightMarginCells_%s" % curBD] = 0
+	if "deadCells_%s" % curBD not in brlextConf.keys():
+		config.conf["brailleExtender"]["deadCells_%s" % curBD] = ""
+	if "deadDots_%s" % curBD not in brlextConf.keys():
+		config.conf["brailleExtender"]["deadDots_%s" % curBD] = ""
+	if "deadDotsReplacements_%s" % curBD not in brlextConf.keys():
+		config.conf["brailleExtender"]["deadDotsReplacements_%s" % curBD] = ""
 	if "autoScrollDelay_%s" % curBD not in brlextConf.keys():
 		config.conf["brailleExtender"]["autoScrollDelay_%s" % curBD] = 3000
 	if "keyboardLayout_%s" % curBD not in brlextConf.keys():
@@ -296,9 +319,7 @@ def loadConf():
 		if curBD != "noBraille": log.warn("%s inaccessible" % confGen)
 		else: log.debug("No braille display present")
 
-	limitCellsRight = int(config.conf["brailleExtender"]["rightMarginCells_%s" % curBD])
-	if (backupDisplaySize-limitCellsRight <= backupDisplaySize and limitCellsRight > 0):
-		braille.handler.displaySize = backupDisplaySize-limitCellsRight
+	displaylayout.refresh()
 	if not noUnicodeTable: loadPreferedTables()
 	if config.conf["brailleExtender"]["inputTableShortcuts"] not in tablesUFN: config.conf["brailleExtender"]["inputTableShortcuts"] = '?'
 	if config.conf["brailleExtender"]["features"]["roleLabels"]:
@@ -4,16 +4,22 @@
 import codecs
 import json
 import os
-from collections import namedtuple
+from bisect import bisect_left, insort
+from collections import Counter, namedtuple
 
 import addonHandler
+import braille
 import brailleInput
 import brailleTables
 import config
 import gui
 import ui
 import wx
+from logHandler import log
 
+from . import abbreviationstore
+from . import regionhelper
+from .abbreviationstore import AbbreviationStore
 from .common import configDir
 from .utils import getTextInBraille
 
@@ -23,85 +29,292 @@ AdvancedInputModeDictEntry = namedtuple(
 	"AdvancedInputModeDictEntry", ("abreviation", "replaceBy", "table")
 )
 
-entries = None
+CANDIDATES_SEPARATOR = " ⠸ "
+CANDIDATE_LABEL_SIZE = 20
+# Maximum number of unused records read to complete the candidate list
+CANDIDATES_SCAN_FACTOR = 8
+# Number of uses after which the usage counter is written to disk
+USAGE_FLUSH_THRESHOLD = 16
+
+store = None
+usage = Counter()
+_unsavedUsage = 0
+# Record index -> usage count, and the sorted list of used record indexes
+_usageByRecord = {}
+_usedRecords = []
+_shownCandidates = None
 
 
 def getPathDict():
 	return f"{configDir}/advancedInputMode.json"
 
 
+def getPathStore():
+	return f"{configDir}/advancedInputMode.dat"
+
+
+def getPathUsage():
+	return f"{configDir}/advancedInputModeUsage.json"
+
+
+def getStore():
+	global store
+	if store is None:
+		store = AbbreviationStore()
+	return store
+
+
 def getDictionary():
-	return entries if entries else []
+	return [AdvancedInputModeDictEntry._make(entry) for entry in getStore()]
 
 
-def initialize():
-	global entries
-	entries = []
-	fp = getPathDict()
-	if not os.path.exists(fp):
-		return
+def loadJSON(fp):
 	json_ = json.load(codecs.open(fp, "r", "UTF-8"))
-	for entry in json_:
-		entries.append(
-			AdvancedInputModeDictEntry(
-				entry["abreviation"], entry["replaceBy"], entry["table"]
-			)
+	return [
+		AdvancedInputModeDictEntry(
+			entry["abreviation"], entry["replaceBy"], entry["table"]
 		)
+		for entry in json_
+	]
+
+
+def initialize():
+	global store
+	# Counts since the last write would be lost when the usage is loaded again
+	flushUsage()
+	if store is not None:
+		store.close()
+	store = None
+	jsonPath = getPathDict()
+	storePath = getPathStore()
+	storeExists = os.path.exists(storePath)
+	if os.path.exists(jsonPath) and (
+		not storeExists or os.path.getmtime(jsonPath) > os.path.getmtime(storePath)
+	):
+		# The JSON file is new or has been edited: (re)compile it
+		try:
+			abbreviationstore.write(storePath, loadJSON(jsonPath))
+			storeExists = True
+			log.debug(f"{jsonPath} compiled to {storePath}")
+		except (ValueError, KeyError, OSError) as err:
+			log.error(f"Unable to compile {jsonPath}: {err}")
+	if storeExists:
+		try:
+			store = AbbreviationStore.open(storePath)
+		except (OSError, ValueError) as err:
+			log.error(f"Unable to load {storePath}: {err}")
+	loadUsage()
+	buildUsageIndex()
 
 
 def terminate(save=False):
-	global entries
+	global store
 	if save:
 		saveDict()
-	entries = None
-
-
-def setDict(newDict):
-	global entries
-	entries = newDict
+	flushUsage()
+	clearCandidates()
+	if store is not None:
+		store.close()
+	store = None
 
 
 def saveDict(entries=None):
-	if not entries:
+	global store
+	if entries is None:
 		entries = getDictionary()
+	if store is not None:
+		# The file can't be replaced while it is mapped
+		store.close()
+	storePath = getPathStore()
+	try:
+		abbreviationstore.write(storePath, entries)
+	finally:
+		store = AbbreviationStore.open(storePath) if os.path.exists(storePath) else None
+		buildUsageIndex()
+
+
+def exportDict(path=None):
+	"""Exports the dictionary to a JSON file (by default the one which is compiled at startup)."""
+	if not path:
+		path = getPathDict()
 	entries = [
 		{
 			"abreviation": entry.abreviation,
 			"replaceBy": entry.replaceBy,
 			"table": entry.table,
 		}
-		for entry in entries
+		for entry in getDictionary()
 	]
-	with codecs.open(getPathDict(), "w", "UTF-8") as outfile:
+	with codecs.open(path, "w", "UTF-8") as outfile:
 		json.dump(entries, outfile, ensure_ascii=False, indent=2)
+	storePath = getPathStore()
+	if path == getPathDict() and os.path.exists(storePath):
+		# Avoid compiling again an export that is identical to the store
+		os.utime(storePath)
 
 
-def getReplacements(abreviations, strict=False):
+def getReplacements(abreviations, strict=False, limit=None):
 	if isinstance(abreviations, str):
 		abreviations = [abreviations]
 	currentInputTable = brailleInput.handler.table.fileName
+	store = getStore()
 	out = []
 	for abreviation in abreviations:
 		if abreviation.endswith("⠀"):
 			strict = True
 			abreviation = abreviation[:-1]
-		if not strict:
-			out += [
-				entry
-				for entry in getDictionary()
-				if entry.abreviation.startswith(abreviation)
-				and entry.table in [currentInputTable, "*"]
-			]
-		else:
-			out += [
-				entry
-				for entry in getDictionary()
-				if entry.abreviation == abreviation
-				and entry.table in [currentInputTable, "*"]
-			]
+		start, end = store.exactRange(abreviation) if strict else store.prefixRange(abreviation)
+		for i in range(start, end):
+			entry = store.entry(i)
+			if entry[2] in [currentInputTable, "*"]:
+				out.append(AdvancedInputModeDictEntry._make(entry))
+				if limit and len(out) >= limit:
+					return out
 	return out
 
 
+def loadUsage():
+	global _unsavedUsage
+	usage.clear()
+	_unsavedUsage = 0
+	fp = getPathUsage()
+	if not os.path.exists(fp):
+		return
+	try:
+		for abreviation, replaceBy, count in json.load(codecs.open(fp, "r", "UTF-8")):
+			usage[(abreviation, replaceBy)] = count
+	except (ValueError, TypeError, OSError) as err:
+		log.error(f"Unable to load {fp}: {err}")
+
+
+def flushUsage():
+	global _unsavedUsage
+	if not _unsavedUsage:
+		return
+	with codecs.open(getPathUsage(), "w", "UTF-8") as outfile:
+		json.dump([
+			[abreviation, replaceBy, count]
+			for (abreviation, replaceBy), count in usage.items()
+		], outfile, ensure_ascii=False)
+	_unsavedUsage = 0
+
+
+def _findRecords(abreviation, replaceBy):
+	store = getStore()
+	start, end = store.exactRange(abreviation)
+	return [i for i in range(start, end) if store.entry(i)[1] == replaceBy]
+
+
+def buildUsageIndex():
+	"""Maps the usage counter on the records of the current store."""
+	global _usageByRecord, _usedRecords
+	_usageByRecord = {}
+	for (abreviation, replaceBy), count in usage.items():
+		for i in _findRecords(abreviation, replaceBy):
+			_usageByRecord[i] = count
+	_usedRecords = sorted(_usageByRecord)
+
+
+def recordUsage(entry):
+	global _unsavedUsage
+	key = (entry.abreviation, entry.replaceBy)
+	usage[key] += 1
+	_unsavedUsage += 1
+	for i in _findRecords(*key):
+		if i not in _usageByRecord:
+			insort(_usedRecords, i)
+		_usageByRecord[i] = usage[key]
+	if _unsavedUsage >= USAGE_FLUSH_THRESHOLD:
+		flushUsage()
+
+
+def getCandidates(abreviation, limit=None):
+	"""Returns the entries which complete `abreviation`, the most used first."""
+	if not limit:
+		limit = config.conf["brailleExtender"]["advancedInputMode"]["maxCandidates"]
+	tables = [brailleInput.handler.table.fileName, "*"]
+	store = getStore()
+	if abreviation.endswith("⠀"):
+		start, end = store.exactRange(abreviation[:-1])
+	else:
+		start, end = store.prefixRange(abreviation)
+	used = _usedRecords[bisect_left(_usedRecords, start):bisect_left(_usedRecords, end)]
+	used.sort(key=lambda i: -_usageByRecord[i])
+	candidates = []
+	for i in used:
+		entry = store.entry(i)
+		if entry[2] in tables:
+			candidates.append(AdvancedInputModeDictEntry._make(entry))
+			if len(candidates) >= limit:
+				return candidates
+	i = start
+	end = min(end, start + limit * CANDIDATES_SCAN_FACTOR)
+	while i < end and len(candidates) < limit:
+		if i not in _usageByRecord:
+			entry = store.entry(i)
+			if entry[2] in tables:
+				candidates.append(AdvancedInputModeDictEntry._make(entry))
+		i += 1
+	return candidates
+
+
+def showCandidates(candidates):
+	"""Shows candidates on the braille display. They can be selected with routing keys."""
+	global _shownCandidates
+	if not candidates:
+		return clearCandidates()
+	labels = []
+	spans = []
+	pos = 0
+	for entry in candidates:
+		label = entry.replaceBy.replace("\n", " ")
+		if len(label) > CANDIDATE_LABEL_SIZE:
+			label = label[:CANDIDATE_LABEL_SIZE - 1] + "…"
+		labels.append(label)
+		spans.append((pos, pos + len(label), entry))
+		pos += len(label) + len(CANDIDATES_SEPARATOR)
+	text = CANDIDATES_SEPARATOR.join(labels)
+	_shownCandidates = (text, spans)
+	braille.handler.message(text)
+
+
+def _getCandidatesRegion():
+	if not _shownCandidates:
+		return None
+	handler = braille.handler
+	if handler.buffer is not handler.messageBuffer or not handler.messageBuffer.regions:
+		return None
+	region = handler.messageBuffer.regions[0]
+	if region.rawText != _shownCandidates[0]:
+		return None
+	return region
+
+
+def getShownCandidate(routingIndex):
+	"""Returns the candidate under a routing key, if candidates are shown."""
+	region = _getCandidatesRegion()
+	if not region:
+		return None
+	try:
+		routedRegion, span = regionhelper.getRawSpanFromWindowPos(routingIndex)
+	except (LookupError, AttributeError):
+		return None
+	if routedRegion is not region:
+		return None
+	rawPos = span[0]
+	for start, end, entry in _shownCandidates[1]:
+		if start <= rawPos < end:
+			return entry
+	return None
+
+
+def clearCandidates():
+	global _shownCandidates
+	if _getCandidatesRegion():
+		braille.handler._dismissMessage()
+	_shownCandidates = None
+
+
 def translateTable(tableFilename):
 	if tableFilename == "*":
 		return _("all tables")
@@ -164,6 +377,11 @@ class AdvancedInputModeDlg(gui.settingsDialogs.SettingsDialog):
 			# Translators: The label for a button in advanced input mode dictionariy dialog to reload dictionary.
 			label=_("&Reload the dictionary"),
 		).Bind(wx.EVT_BUTTON, self.onReloadDictClick)
+		bHelper.addButton(
+			parent=self,
+			# Translators: The label for a button in advanced input mode dictionariy dialog to export dictionary.
+			label=_("E&xport to JSON..."),
+		).Bind(wx.EVT_BUTTON, self.onExportClick)
 		sHelper.addItem(bHelper)
 
 	def onSetEntries(self):
@@ -220,23 +438,37 @@ class AdvancedInputModeDlg(gui.settingsDialogs.SettingsDialog):
 
 	def onOpenFileClick(self, event):
 		dictPath = getPathDict()
-		if not os.path.exists(dictPath):
+		if not len(getStore()):
 			return ui.message(_("File doesn't exist yet"))
+		exportDict(dictPath)
 		try:
 			os.startfile(dictPath)
 		except OSError:
 			os.popen('notepad "%s"' % dictPath)
 
 	def onReloadDictClick(self, event):
+		initialize()
 		self.tmpDict = getDictionary()
 		self.onSetEntries()
 
+	def onExportClick(self, event):
+		with wx.FileDialog(
+			self,
+			# Translators: title of a file dialog.
+			_("Export the dictionary"),
+			defaultFile="advancedInputMode.json",
+			wildcard="JSON (*.json)|*.json",
+			style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT
+		) as fileDialog:
+			if fileDialog.ShowModal() != wx.ID_OK:
+				return
+			exportDict(fileDialog.GetPath())
+
 	def postInit(self):
 		self.dictList.SetFocus()
 
 	def onOk(self, evt):
 		saveDict(self.tmpDict)
-		setDict(self.tmpDict)
 		super().onOk(evt)
 
 
@@ -297,9 +529,37 @@ class SettingsDlg(gui.settingsDialogs.SettingsPanel):
 			wx.TextCtrl,
 			value=config.conf["brailleExtender"]["advancedInputMode"]["escapeSignUnicodeValue"],
 		)
+		# Translators: label of a dialog.
+		self.showCandidates = sHelper.addItem(
+			wx.CheckBox(
+				self, label=_("Show &completion candidates, selectable with routing keys")
+			)
+		)
+		self.showCandidates.SetValue(
+			config.conf["brailleExtender"]["advancedInputMode"]["showCandidates"]
+		)
+		# Translators: label of a dialog.
+		self.maxCandidates = sHelper.addLabeledControl(
+			_("&Maximum number of candidates"),
+			gui.nvdaControls.SelectOnFocusSpinCtrl,
+			min=1,
+			max=20,
+			initial=config.conf["brailleExtender"]["advancedInputMode"]["maxCandidates"],
+		)
+		# Translators: label of a dialog.
+		self.sendRateLimit = sHelper.addLabeledControl(
+			_("&Rate limit when typing replacements (characters per second, 0 for no limit)"),
+			gui.nvdaControls.SelectOnFocusSpinCtrl,
+			min=0,
+			max=10000,
+			initial=config.conf["brailleExtender"]["advancedInputMode"]["sendRateLimit"],
+		)
 
 	def onSave(self):
 		config.conf["brailleExtender"]["advancedInputMode"]["stopAfterOneChar"] = self.stopAdvancedInputModeAfterOneChar.IsChecked()
+		config.conf["brailleExtender"]["advancedInputMode"]["showCandidates"] = self.showCandidates.IsChecked()
+		config.conf["brailleExtender"]["advancedInputMode"]["maxCandidates"] = self.maxCandidates.Value
+		config.conf["brailleExtender"]["advancedInputMode"]["sendRateLimit"] = self.sendRateLimit.Value
 		s = self.escapeSignUnicodeValue.Value
 		if s:
 			config.conf["brailleExtender"]["advancedInputMode"]["escapeSignUnicodeValue"] = getTextInBraille(
@@ -0,0 +1,102 @@
+# autoscroll.py
+# Part of BrailleExtender addon for NVDA
+# Copyright 2016-2021 André-Abush CLAUSE, released under GPL.
+# Automatic braille scroll.
+# The time spent on each window can follow its content at a reading rate in cells per minute.
+# Blank windows are passed over without pause, and the end of the document is only checked when the line changes.
+
+import braille
+import config
+import wx
+
+from . import addoncfg
+from . import utils
+
+# Shortest time spent on a window (ms)
+MIN_DWELL = 250
+# A word is read as this number of additional cells
+WORD_WEIGHT = 2
+# Maximal number of blank windows passed over in a row
+MAX_BLANK_WINDOWS = 32
+
+
+def getContent(cells):
+	"""Returns the number of non-blank cells and the number of words in `cells`."""
+	nonBlank = words = 0
+	inWord = False
+	for cell in cells:
+		if cell:
+			nonBlank += 1
+			if not inWord: words += 1
+			inWord = True
+		else: inWord = False
+	return nonBlank, words
+
+
+def getDwell(nonBlank, words):
+	"""Returns the time to spend on a window with this content (ms)."""
+	if not config.conf["brailleExtender"]["autoScrollAdaptive"]:
+		return int(config.conf["brailleExtender"]["autoScrollDelay_%s" % addoncfg.curBD])
+	rate = config.conf["brailleExtender"]["autoScrollRate"]
+	return max(MIN_DWELL, int((nonBlank + words * WORD_WEIGHT) * 60000 / rate))
+
+
+class AutoScroll:
+	"""Scrolls the braille display forward until `onEnd` is called at the end of the document."""
+
+	def __init__(self, onEnd):
+		self.onEnd = onEnd
+		self.running = False
+		self.timer = wx.PyTimer(self.onTimer)
+		# Whether the caret is on the last line, None when it must be checked again
+		self._lastLine = None
+		self._windowStartPos = None
+
+	def start(self):
+		self.running = True
+		self._lastLine = None
+		self.schedule()
+
+	def stop(self):
+		self.running = False
+		self.timer.Stop()
+
+	def restart(self):
+		if not self.running: return
+		self.timer.Stop()
+		self.schedule()
+
+	@staticmethod
+	def getWindow():
+		buffer = braille.handler.buffer
+		return buffer.brailleCells[buffer.windowStartPos:buffer.windowEndPos]
+
+	def schedule(self):
+		self._windowStartPos = braille.handler.buffer.windowStartPos
+		self.timer.StartOnce(getDwell(*getContent(self.getWindow())))
+
+	def isLastLine(self):
+		if self._lastLine is None: self._lastLine = utils.isLastLine()
+		return self._lastLine
+
+	def isAtEnd(self):
+		buffer = braille.handler.buffer
+		return buffer.windowEndPos >= len(buffer.brailleCells) and self.isLastLine()
+
+	def onTimer(self):
+		if not self.running: return
+		buffer = braille.handler.buffer
+		# The window was moved by the user meanwhile
+		if buffer.windowStartPos != self._windowStartPos: self._lastLine = None
+		if self.isAtEnd():
+			self.stop()
+			self.onEnd()
+			return
+		for i in range(MAX_BLANK_WINDOWS):
+			windowStartPos = buffer.windowStartPos
+			braille.handler.scrollForward()
+			buffer = braille.handler.buffer
+			# The window goes back to the start of a line when the line changes
+			if buffer.windowStartPos <= windowStartPos: self._lastLine = None
+			if any(self.getWindow()) or self.isAtEnd(): break
+		self.schedule()
@@ -0,0 +1,103 @@
+# blanklines.py
+# Part of BrailleExtender addon for NVDA
+# Copyright 2016-2021 André-Abush CLAUSE, released under GPL.
+# Skipping of blank lines while scrolling.
+# Several lines are checked per text fetch, and the number of skipped lines and the time spent are bounded.
+
+import time
+
+import config
+import textInfos
+
+BATCH_SIZE = 4
+MAX_BATCH_SIZE = 64
+
+FOUND = 0
+LIMIT_REACHED = 1
+END_REACHED = 2
+
+
+def isBlank(info):
+	return not (info.text or '').strip()
+
+
+def getLine(info):
+	line = info.copy()
+	line.expand(textInfos.UNIT_LINE)
+	return line
+
+
+def _reaches(start, end, count):
+	"""Returns whether moving `start` by `count` lines reaches `end`."""
+	probe = start.copy()
+	moved = probe.move(textInfos.UNIT_LINE, count)
+	return moved < count or probe.compareEndPoints(end, "startToStart") >= 0
+
+
+def countLines(start, end, limit):
+	"""Returns the number of lines from `start` to `end`, None if it is more than `limit`.
+	Only a few line moves are made, whatever the distance.
+	"""
+	if limit < 1 or not _reaches(start, end, limit): return None
+	lo, hi = 1, limit
+	while lo < hi:
+		mid = (lo + hi) // 2
+		if _reaches(start, end, mid): hi = mid
+		else: lo = mid + 1
+	return lo
+
+
+def _jumpToParagraph(dest, maxLines):
+	"""Moves `dest` to the start of the next paragraph if only blank text lies between them,
+	and there are at most `maxLines` lines to skip. Returns the number of skipped lines.
+	"""
+	paragraph = dest.copy()
+	if not paragraph.move(textInfos.UNIT_PARAGRAPH, 1) or paragraph.compareEndPoints(dest, "startToStart") <= 0:
+		return 0
+	between = dest.copy()
+	between.setEndPoint(paragraph, "endToStart")
+	if not isBlank(between): return 0
+	count = countLines(dest, paragraph, maxLines)
+	if not count: return 0
+	dest.setEndPoint(paragraph, "startToStart")
+	dest.collapse()
+	return count
+
+
+def skip(dest, direction):
+	"""Moves the collapsed `dest` out of blank lines, forward if `direction` is 1, backward if it is -1.
+	Returns FOUND when `dest` is on a line with text, LIMIT_REACHED when the maximal distance or time is reached
+	and END_REACHED at the boundary of the document.
+	"""
+	line = getLine(dest)
+	if not isBlank(line): return FOUND
+	maxLines = config.conf["brailleExtender"]["skipBlankLinesMax"]
+	deadline = time.time() + config.conf["brailleExtender"]["skipBlankLinesTimeout"] / 1000
+	skipped = 0
+	if direction > 0:
+		skipped = _jumpToParagraph(dest, maxLines)
+		if skipped:
+			line = getLine(dest)
+			if not isBlank(line): return FOUND
+	batch = BATCH_SIZE
+	while skipped < maxLines:
+		if time.time() > deadline: return LIMIT_REACHED
+		count = min(batch, maxLines - skipped)
+		# The current line and the `count` next ones, in a single fetch
+		chunk = line.copy()
+		if direction > 0: chunk.move(textInfos.UNIT_LINE, count, endPoint="end")
+		else: chunk.move(textInfos.UNIT_LINE, -count, endPoint="start")
+		blank = isBlank(chunk)
+		if not blank and count > 1:
+			# Text within the chunk, look closer
+			batch = count // 2
+			continue
+		moved = dest.move(textInfos.UNIT_LINE, count * direction)
+		if not moved: return END_REACHED
+		skipped += abs(moved)
+		# Only the last line of a chunk of one line can have text
+		if not blank: return FOUND
+		if abs(moved) < count: return END_REACHED
+		line = getLine(dest)
+		batch = min(batch * 2, MAX_BATCH_SIZE)
+	return LIMIT_REACHED
@@ -0,0 +1,99 @@
+# blink.py
+# Part of BrailleExtender addon for NVDA
+# Copyright 2016-2021 André-Abush CLAUSE, released under GPL.
+# Blinking of the dots used by attribra to mark text attributes.
+# Only the cells already rendered in the current window are changed,
+# regions are neither updated nor translated again.
+
+import braille
+import config
+import wx
+
+_timer = None
+_hidden = False
+
+
+def isEnabled():
+	return (
+		config.conf["brailleExtender"]["blinkAttributes"]
+		and config.conf["brailleExtender"]["features"]["attributes"]
+	)
+
+
+def refresh():
+	"""Starts or stops blinking according to the configuration."""
+	global _timer, _hidden
+	if _timer:
+		_timer.Stop()
+		_timer = None
+	wasHidden = _hidden
+	_hidden = False
+	if isEnabled():
+		_timer = wx.PyTimer(_onTimer)
+		_timer.Start(config.conf["brailleExtender"]["blinkAttributesRate"])
+	if wasHidden: _redisplay()
+
+
+def terminate():
+	global _timer, _hidden
+	if _timer:
+		_timer.Stop()
+		_timer = None
+	_hidden = False
+
+
+def getWindowMasks(handler):
+	"""Returns (window position, dot mask) tuples for the attribute cells of the current window.
+	Selected cells are left out, so the selection indicator doesn't blink.
+	"""
+	buffer = handler.buffer
+	if buffer is not handler.mainBuffer: return []
+	windowStart = buffer.windowStartPos
+	windowEnd = buffer.windowEndPos
+	masks = []
+	for region, regionStart, regionEnd in buffer.regionsWithPositions:
+		if regionEnd <= windowStart: continue
+		if regionStart >= windowEnd: break
+		spans = getattr(region, "attribraSpans", None)
+		if not spans: continue
+		selectionStart = getattr(region, "brailleSelectionStart", None)
+		selectionEnd = getattr(region, "brailleSelectionEnd", None)
+		if selectionStart is None or selectionEnd is None: selectionStart = selectionEnd = 0
+		for start, end, mask in spans:
+			start = max(regionStart + start, windowStart)
+			end = min(regionStart + end, windowEnd)
+			masks += [
+				(pos - windowStart, mask) for pos in range(start, end)
+				if not selectionStart <= pos - regionStart < selectionEnd
+			]
+	return masks
+
+
+def process(handler, cells):
+	"""Removes the attribute dots from the cells to write during the hidden phase."""
+	if not _hidden: return cells
+	masks = getWindowMasks(handler)
+	if not masks: return cells
+	cells = list(cells)
+	cursorPos = handler._cursorPos
+	size = len(cells)
+	for pos, mask in masks:
+		if pos != cursorPos and pos < size: cells[pos] &= ~mask
+	return cells
+
+
+def _redisplay():
+	handler = braille.handler
+	if handler and handler.buffer is handler.mainBuffer and handler._cells:
+		handler._displayWithCursor()
+
+
+def _onTimer():
+	global _hidden
+	handler = braille.handler
+	if not handler or not getWindowMasks(handler):
+		# Nothing to blink in this window, don't write to the display
+		_hidden = False
+		return
+	_hidden = not _hidden
+	_redisplay()
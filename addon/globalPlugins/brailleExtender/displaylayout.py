@@ -0,0 +1,160 @@
+# displaylayout.py
+# Part of BrailleExtender addon for NVDA
+# Copyright 2016-2021 André-Abush CLAUSE, released under GPL.
+# Mapping between the window rendered by NVDA (logical cells) and the cells of the braille display (physical cells).
+# Margins and dead cells are skipped, dead dots are removed or replaced by other dots through lookup tables
+# and the window can be mirrored to read from right to left.
+# This is done on the final window only: no braille translation is involved.
+
+import braille
+import config
+from logHandler import log
+
+ALL_CELLS = '*'
+
+physicalSize = 0
+_logicalToPhysical = []
+_physicalToLogical = {}
+_luts = []
+_lutsByMask = {}
+_active = False
+
+
+def getDisplaySetting(key, default=''):
+	displayName = braille.handler.display.name
+	try: return config.conf["brailleExtender"]["%s_%s" % (key, displayName)]
+	except KeyError: return default
+
+
+def parseCells(text):
+	"""Returns the 0-based positions of a list of 1-based cell numbers such as "3, 17 40"."""
+	cells = set()
+	for token in text.replace(',', ' ').split():
+		if token.isdigit() and int(token) > 0: cells.add(int(token) - 1)
+		else: log.debug("Invalid cell: %s" % token)
+	return cells
+
+
+def getDotsMask(dots):
+	mask = 0
+	for dot in dots:
+		if dot in "12345678": mask |= 1 << (int(dot) - 1)
+	return mask
+
+
+def parseDeadDots(text, size):
+	"""Returns {position: mask} from a list such as "3:78 17:4". `*` stands for all cells."""
+	deadDots = {}
+	for token in text.replace(',', ' ').split():
+		cell, sep, dots = token.partition(':')
+		mask = getDotsMask(dots)
+		if not sep or not mask or not (cell == ALL_CELLS or cell.isdigit() and int(cell) > 0):
+			log.debug("Invalid dead dots: %s" % token)
+			continue
+		for pos in (range(size) if cell == ALL_CELLS else [int(cell) - 1]):
+			deadDots[pos] = deadDots.get(pos, 0) | mask
+	return deadDots
+
+
+def parseDotReplacements(text):
+	"""Returns ((dot mask, replacement mask), ...) from a list such as "1:7 4:8", sorted by dot."""
+	replacements = {}
+	for token in text.replace(',', ' ').split():
+		dot, sep, replacement = token.partition(':')
+		if not sep or len(dot) != 1 or not getDotsMask(dot) or not getDotsMask(replacement):
+			log.debug("Invalid dot replacement: %s" % token)
+			continue
+		replacements[getDotsMask(dot)] = getDotsMask(replacement)
+	return tuple(sorted(replacements.items()))
+
+
+def getLUT(mask, replacements=()):
+	"""Returns the 256-entry table substituting the patterns affected by the dead dots of `mask`.
+	Lost dots are removed. A lost dot listed in `replacements` raises its replacement dots instead,
+	unless they are dead as well. Patterns stay distinct as long as each lost dot has its own replacement dots
+	not used by the text, for example dots 7 and 8 with six-dot braille.
+	"""
+	key = (mask, replacements)
+	lut = _lutsByMask.get(key)
+	if lut is None:
+		lut = []
+		for cell in range(256):
+			lost = cell & mask
+			for dot, replacement in replacements:
+				if lost & dot: cell |= replacement
+			lut.append(cell & ~mask)
+		_lutsByMask[key] = lut
+	return lut
+
+
+def getUsablePositions(size):
+	"""Returns the physical positions NVDA may render to, inside the margins."""
+	leftMargin = int(getDisplaySetting("leftMarginCells", 0))
+	rightMargin = int(getDisplaySetting("rightMarginCells", 0))
+	if leftMargin + rightMargin >= size:
+		log.error("Margins larger than the braille display, ignored")
+		leftMargin = rightMargin = 0
+	return range(leftMargin, size - rightMargin)
+
+
+def refresh():
+	"""Computes the layout of the active braille display and adjusts the size of the window accordingly."""
+	global physicalSize, _logicalToPhysical, _physicalToLogical, _luts, _active
+	handler = braille.handler
+	if not handler: return
+	physicalSize = handler.display.numCells
+	deadCells = parseCells(getDisplaySetting("deadCells"))
+	deadDots = parseDeadDots(getDisplaySetting("deadDots"), physicalSize)
+	replacements = parseDotReplacements(getDisplaySetting("deadDotsReplacements"))
+	positions = [pos for pos in getUsablePositions(physicalSize) if pos not in deadCells]
+	if physicalSize and not positions:
+		log.error("No usable cell left on the braille display, layout ignored")
+		positions = list(range(physicalSize))
+		deadDots = {}
+	if config.conf["brailleExtender"]["rightToLeft"]: positions.reverse()
+	_logicalToPhysical = positions
+	_physicalToLogical = {pos: i for i, pos in enumerate(positions)}
+	_luts = [(pos, getLUT(mask, replacements)) for pos, mask in sorted(deadDots.items()) if pos < physicalSize]
+	_active = bool(physicalSize) and (positions != list(range(physicalSize)) or bool(_luts))
+	if handler.displaySize != len(positions): handler.displaySize = len(positions)
+	if handler.buffer:
+		try: handler.buffer.updateDisplay()
+		except Exception as err: log.debug(err)
+
+
+def terminate():
+	"""Gives the whole braille display back to NVDA."""
+	global _logicalToPhysical, _physicalToLogical, _luts, _active
+	_logicalToPhysical = []
+	_physicalToLogical = {}
+	_luts = []
+	_active = False
+	handler = braille.handler
+	if not handler: return
+	if handler.displaySize != handler.display.numCells: handler.displaySize = handler.display.numCells
+	if handler.buffer:
+		try: handler.buffer.updateDisplay()
+		except Exception as err: log.debug(err)
+
+
+def onDisplayChanged(display=None, **kwargs):
+	refresh()
+
+
+def isActive():
+	return _active
+
+
+def process(cells):
+	"""Returns the physical cells to write for the logical `cells`."""
+	if not _active: return cells
+	out = [0] * physicalSize
+	for pos, cell in zip(_logicalToPhysical, cells): out[pos] = cell
+	for pos, lut in _luts: out[pos] = lut[out[pos]]
+	return out
+
+
+def toLogicalIndex(pos):
+	"""Returns the window position for a physical routing index, None for cells that are not used."""
+	if not _active: return pos
+	return _physicalToLogical.get(pos)
@@ -0,0 +1,199 @@
+# outline.py
+# Part of BrailleExtender addon for NVDA
+# Copyright 2016-2021 André-Abush CLAUSE, released under GPL.
+# Outline of browse mode documents for the rotor.
+# The elements of a virtual buffer are indexed by type in bounded steps when it is loaded,
+# so that the rotor can count them, jump over several of them and list the next ones in braille.
+
+import time
+
+import braille
+import config
+import core
+import textInfos
+from logHandler import log
+
+from . import regionhelper
+from .textposition import getDirectOffsets
+
+# Maximal time spent indexing in a row (s)
+STEP_BUDGET = 0.03
+# Delay between two indexing steps (ms)
+STEP_DELAY = 20
+# Rotor items which are not browse mode node types
+NOT_INDEXED = frozenset(["notLinkBlock", "error"])
+ITEMS_SEPARATOR = " ⠸ "
+ITEM_LABEL_SIZE = 20
+LIST_SIZE = 8
+
+_outline = None
+_shownItems = None
+
+
+def isEnabled():
+	return config.conf["brailleExtender"]["outlineIndex"]
+
+
+def getItemType(rotorItemName):
+	"""Returns the browse mode node type of a rotor item, e.g. heading1 for Heading1."""
+	return rotorItemName[0].lower() + rotorItemName[1:]
+
+
+def getStoryLength(document):
+	offsets = getDirectOffsets(document.makeTextInfo(textInfos.POSITION_FIRST))
+	return offsets[1] if offsets else None
+
+
+class Outline:
+	"""Elements of a document by node type, in document order."""
+
+	def __init__(self, document, itemTypes):
+		self.document = document
+		self.storyLength = getStoryLength(document)
+		self.items = {}
+		self.pending = [itemType for itemType in itemTypes if itemType not in NOT_INDEXED]
+		self.complete = not self.pending
+		self._nodes = None
+
+	def step(self, budget=STEP_BUDGET):
+		deadline = time.time() + budget
+		while self.pending and time.time() < deadline:
+			itemType = self.pending[0]
+			try:
+				if self._nodes is None:
+					self.items[itemType] = []
+					self._nodes = self.document._iterNodesByType(itemType, "next", None)
+				self.items[itemType].append(next(self._nodes))
+				continue
+			except StopIteration: pass
+			except Exception as err:
+				# Node type not supported by this document
+				log.debug("%s: %s" % (itemType, err))
+				self.items.pop(itemType, None)
+			self.pending.pop(0)
+			self._nodes = None
+		self.complete = not self.pending
+		return self.complete
+
+	def isValid(self):
+		try: return self.document.isAlive and getStoryLength(self.document) == self.storyLength
+		except Exception as err:
+			log.debug(err)
+			return False
+
+	def getItems(self, itemType):
+		"""Returns the elements of a type, None if they are not indexed."""
+		if not self.complete: return None
+		return self.items.get(itemType)
+
+	@staticmethod
+	def countBefore(items, caret, inclusive=False):
+		"""Returns the number of elements starting before `caret`, or at `caret` if `inclusive`."""
+		lo, hi = 0, len(items)
+		limit = 0 if inclusive else -1
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if items[mid].textInfo.compareEndPoints(caret, "startToStart") <= limit: lo = mid + 1
+			else: hi = mid
+		return lo
+
+
+def build(document, itemTypes):
+	"""Indexes `document` in the background, unless it is already."""
+	global _outline
+	if _outline and _outline.document is document and _outline.isValid(): return
+	_outline = Outline(document, itemTypes)
+	core.callLater(STEP_DELAY, _continue, _outline)
+
+
+def _continue(outline):
+	if outline is not _outline: return
+	try: complete = outline.step()
+	except Exception as err:
+		log.debug(err)
+		return
+	if not complete: core.callLater(STEP_DELAY, _continue, outline)
+
+
+def getOutline(document):
+	"""Returns the complete outline of `document`, None if it is not available."""
+	if not _outline or _outline.document is not document or not _outline.complete: return None
+	if not _outline.isValid(): return None
+	return _outline
+
+
+def getItems(document, itemType):
+	outline = getOutline(document)
+	return outline.getItems(itemType) if outline else None
+
+
+def getItemsAround(document, itemType, inclusive=True):
+	"""Returns the elements of a type and the number of them starting before the caret, or at the caret if `inclusive`.
+	Returns None if they are not indexed.
+	"""
+	items = getItems(document, itemType)
+	if items is None: return None
+	caret = document.makeTextInfo(textInfos.POSITION_CARET)
+	return items, Outline.countBefore(items, caret, inclusive)
+
+
+def moveBy(document, itemType, count):
+	"""Moves to the element `count` elements away from the caret. Returns False if it doesn't exist."""
+	around = getItemsAround(document, itemType, inclusive=count > 0)
+	if not around: return False
+	items, index = around
+	index = index + count - 1 if count > 0 else index + count
+	if not 0 <= index < len(items): return False
+	item = items[index]
+	item.moveTo()
+	item.report()
+	return True
+
+
+def showNextItems(document, itemType):
+	"""Shows the next elements on the braille display. They can be selected with routing keys."""
+	global _shownItems
+	around = getItemsAround(document, itemType)
+	if not around: return False
+	items, index = around
+	items = items[index:index + LIST_SIZE]
+	if not items: return False
+	labels = []
+	spans = []
+	pos = 0
+	for item in items:
+		label = (item.label or '').replace("\n", " ").strip()
+		if len(label) > ITEM_LABEL_SIZE:
+			label = label[:ITEM_LABEL_SIZE - 1] + "…"
+		labels.append(label)
+		spans.append((pos, pos + len(label), item))
+		pos += len(label) + len(ITEMS_SEPARATOR)
+	text = ITEMS_SEPARATOR.join(labels)
+	_shownItems = (text, spans)
+	braille.handler.message(text)
+	return True
+
+
+def getShownItem(routingIndex):
+	"""Returns the element under a routing key, if elements are shown."""
+	handler = braille.handler
+	if not _shownItems or handler.buffer is not handler.messageBuffer: return None
+	try: region, (start, end) = regionhelper.getRawSpanFromWindowPos(routingIndex)
+	except (LookupError, AttributeError): return None
+	if region.rawText != _shownItems[0]: return None
+	for itemStart, itemEnd, item in _shownItems[1]:
+		if itemStart <= start < itemEnd: return item
+	return None
+
+
+def selectItem(item):
+	global _shownItems
+	_shownItems = None
+	braille.handler._dismissMessage()
+	item.moveTo()
+	item.report()
+
+
+def invalidate():
+	global _outline, _shownItems
+	_outline = _shownItems = None
@@ -33,21 +33,32 @@ from logHandler import log
 
 from . import addoncfg
 from . import advancedinput
+from . import blanklines
+from . import blink
+from . import displaylayout
+from . import readahead
 from . import huc
+from . import outline
 from . import regionhelper
+from . import routing
+from . import textsender
 from . import undefinedchars
 from .common import baseDir
 from .onehand import process as processOneHandMode
-from .utils import getCurrentChar, getSpeechSymbols, getTether, getCharFromValue, getCurrentBrailleTables, get_output_reason
+from .utils import getSpeechSymbols, getTether, getCharFromValue, getCurrentBrailleTables, get_output_reason
 
 addonHandler.initTranslation()
 
 instanceGP = None
+# Returns whether the typeforms of the regions are replaced by tags or markers, set by the global plugin
+typeformsReplaced = lambda: False
 
 SELECTION_SHAPE = lambda: braille.SELECTION_SHAPE
 origFunc = {
 	"script_braille_routeTo": globalCommands.GlobalCommands.script_braille_routeTo,
 	"update": braille.Region.update,
+	# The add-on can be reloaded, the handler must never be wrapped twice
+	"_writeCells": getattr(braille.BrailleHandler._writeCells, "__wrapped__", braille.BrailleHandler._writeCells),
 	"_createTablesString": louis._createTablesString
 }
 
@@ -68,8 +79,32 @@ def sayCurrentLine():
 			info.expand(textInfos.UNIT_LINE)
 			speech.speakTextInfo(info, unit=textInfos.UNIT_LINE, reason=REASON_CARET)
 
+# Time without scrolling before the current line is spoken (ms)
+SAY_LINE_DELAY = 150
+_sayLineTimer = None
+# Number of lines not spoken because scrolling went on, for diagnosis
+sayLineSkipped = 0
+
+def scheduleSayCurrentLine():
+	"""Speaks the current line when scrolling stops. While the user keeps scrolling, only the speech is cancelled."""
+	global _sayLineTimer, sayLineSkipped
+	if _sayLineTimer and _sayLineTimer.IsRunning():
+		_sayLineTimer.Stop()
+		sayLineSkipped += 1
+		log.debug("Scroll speech skipped (%d in total)" % sayLineSkipped)
+	else: queueHandler.queueFunction(queueHandler.eventQueue, speech.cancelSpeech)
+	_sayLineTimer = core.callLater(SAY_LINE_DELAY, sayCurrentLine)
+
 # globalCommands.GlobalCommands.script_braille_routeTo()
 def script_braille_routeTo(self, gesture):
+	candidate = advancedinput.getShownCandidate(gesture.routingIndex)
+	if candidate:
+		selectCandidate(candidate)
+		return
+	item = outline.getShownItem(gesture.routingIndex)
+	if item:
+		outline.selectItem(item)
+		return
 	obj = obj = api.getNavigatorObject()
 	if (config.conf["brailleExtender"]['routingReviewModeWithCursorKeys'] and
 			obj.hasFocus and
@@ -77,30 +112,69 @@ def script_braille_routeTo(self, gesture):
 			(obj.role == controlTypes.ROLE_TERMINAL or
 			 (obj.role == controlTypes.ROLE_EDITABLETEXT and
 			 getTether() == braille.handler.TETHER_REVIEW))):
-		speechMode = speech.speechMode
-		speech.speechMode = 0
-		nb = braille.handler._cursorPos-gesture.routingIndex
-		i = 0
-		key = "leftarrow" if nb > 0 else "rightarrow"
-		while i < abs(nb):
-			keyboardHandler.KeyboardInputGesture.fromName(key).send()
-			i += 1
-		speech.speechMode = speechMode
-		speech.speakSpelling(getCurrentChar())
+		routing.routeWithCursorKeys(obj, gesture.routingIndex)
 		return
 	try: braille.handler.routeTo(gesture.routingIndex)
 	except LookupError: pass
 	if scriptHandler.getLastScriptRepeatCount() == 0 and config.conf["brailleExtender"]["speakRoutingTo"]:
-		region = braille.handler.buffer
+		try: region, (start, end) = regionhelper.getRawSpanFromWindowPos(gesture.routingIndex)
+		except (LookupError, AttributeError): return
 		if region.cursorPos is None: return
-		try:
-			start = region.brailleToRawPos[braille.handler.buffer.windowStartPos + gesture.routingIndex]
-			_, endBraillePos = regionhelper.getBraillePosFromRawPos(region, start)
-			end = region.brailleToRawPos[endBraillePos+1]
-			ch = region.rawText[start:end]
-			if ch:
-				speech.speakMessage(getSpeechSymbols(ch))
-		except IndexError: pass
+		ch = region.rawText[start:end]
+		if ch:
+			speech.speakMessage(getSpeechSymbols(ch))
+
+SELECTED_ELEMENT_DOTS = {
+	addoncfg.CHOICE_dot7: 64,
+	addoncfg.CHOICE_dot8: 128,
+	addoncfg.CHOICE_dots78: 192
+}
+
+def getSelectedNameSpan(region):
+	"""Returns the raw (start, end) span of the name of the selected object shown in `region`, None otherwise.
+	The selection state is read on every update, as NVDA leaves it out of the raw text of list items, tree view items
+	and table rows. Only the span of the name is cached on the region, per object and raw text.
+	"""
+	obj = getattr(region, "obj", None)
+	if not obj: return None
+	states = getattr(obj, "states", None)
+	if not states or controlTypes.STATE_SELECTED not in states: return None
+	rawText = region.rawText
+	cache = getattr(region, "_selectedNameSpan", None)
+	if cache and cache[0] is obj and cache[1] == rawText: return cache[2]
+	span = None
+	name = obj.name
+	start = rawText.find(name) if name else -1
+	if start >= 0: span = (start, start + len(name))
+	region._selectedNameSpan = (obj, rawText, span)
+	return span
+
+def translateRegion(region):
+	"""Translates the raw text of `region`, with the undefined characters processing.
+	A translation prepared by the read-ahead is used if there is one. Returns the translation key.
+	"""
+	mode = louis.dotsIO
+	if config.conf["braille"]["expandAtCursor"] and region.cursorPos is not None: mode |= louis.compbrlAtCursor
+	tables = getCurrentBrailleTables(brf=instanceGP.BRFMode)
+	# With attribute tags, typeforms only identify the attributes and are not meant for liblouis
+	typeform = None if typeformsReplaced() else region.rawTextTypeforms
+	key = readahead.getTranslationKey(tables, region.rawText, typeform, mode, region.cursorPos, region.parseUndefinedChars)
+	translation = readahead.popTranslation(key)
+	if translation:
+		region.brailleCells, region.brailleToRawPos, region.rawToBraillePos = translation
+		cursorPos = region.cursorPos
+		region.brailleCursorPos = region.rawToBraillePos[cursorPos] if cursorPos is not None and cursorPos < len(region.rawToBraillePos) else None
+		return key
+	region.brailleCells, region.brailleToRawPos, region.rawToBraillePos, region.brailleCursorPos = louisHelper.translate(
+		tables,
+		region.rawText,
+		typeform=typeform,
+		mode=mode,
+		cursorPos=region.cursorPos
+	)
+	if region.parseUndefinedChars and config.conf["brailleExtender"]["undefinedCharsRepr"]["method"] != undefinedchars.CHOICE_tableBehaviour:
+		undefinedchars.undefinedCharProcess(region)
+	return key
 
 # braille.Region.update()
 def update(self):
@@ -112,33 +186,17 @@ def update(self):
 	L{brailleCursorPos}, L{brailleSelectionStart} and L{brailleSelectionEnd} are similarly updated based on L{cursorPos}, L{selectionStart} and L{selectionEnd}, respectively.
 	@postcondition: L{brailleCells}, L{brailleCursorPos}, L{brailleSelectionStart} and L{brailleSelectionEnd} are updated and ready for rendering.
 	"""
-	mode = louis.dotsIO
-	if config.conf["braille"]["expandAtCursor"] and self.cursorPos is not None: mode |= louis.compbrlAtCursor
-	self.brailleCells, self.brailleToRawPos, self.rawToBraillePos, self.brailleCursorPos = louisHelper.translate(
-		getCurrentBrailleTables(brf=instanceGP.BRFMode),
-		self.rawText,
-		typeform=self.rawTextTypeforms,
-		mode=mode,
-		cursorPos=self.cursorPos
-	)
-	if self.parseUndefinedChars and config.conf["brailleExtender"]["undefinedCharsRepr"]["method"] != undefinedchars.CHOICE_tableBehaviour:
-		undefinedchars.undefinedCharProcess(self)
-	if config.conf["brailleExtender"]["features"]["attributes"] and config.conf["brailleExtender"]["attributes"]["selectedElement"] != addoncfg.CHOICE_none:
-		d = {
-			addoncfg.CHOICE_dot7: 64,
-			addoncfg.CHOICE_dot8: 128,
-			addoncfg.CHOICE_dots78: 192
-		}
-		if config.conf["brailleExtender"]["attributes"]["selectedElement"] in d:
-			addDots = d[config.conf["brailleExtender"]["attributes"]["selectedElement"]]
-			if hasattr(self, "obj") and self.obj and hasattr(self.obj, "states") and self.obj.states and self.obj.name and controlTypes.STATE_SELECTED in self.obj.states:
-				name = self.obj.name
-				if name in self.rawText:
-					start = self.rawText.index(name)
-					end = start + len(name)-1
-					startBraillePos, _ = regionhelper.getBraillePosFromRawPos(self, start)
-					_, endBraillePos = regionhelper.getBraillePosFromRawPos(self, end)
-					self.brailleCells = [cell | addDots if startBraillePos <= pos <= endBraillePos else cell for pos, cell in enumerate(self.brailleCells)]
+	translateRegion(self)
+	addDots = SELECTED_ELEMENT_DOTS.get(config.conf["brailleExtender"]["attributes"]["selectedElement"]) if config.conf["brailleExtender"]["features"]["attributes"] else None
+	if addDots:
+		span = getSelectedNameSpan(self)
+		if span:
+			start, end = span
+			rawToBraillePos = self.rawToBraillePos
+			cells = self.brailleCells
+			brailleStart = rawToBraillePos[start]
+			brailleEnd = rawToBraillePos[end] if end < len(rawToBraillePos) else len(cells)
+			cells[brailleStart:brailleEnd] = [cell | addDots for cell in cells[brailleStart:brailleEnd]]
 	if self.selectionStart is not None and self.selectionEnd is not None:
 		try:
 			# Mark the selection.
@@ -155,31 +213,35 @@ def update(self):
 			self.brailleCells = [(cell & 63) for cell in self.brailleCells]
 
 
+# braille.BrailleHandler._writeCells()
+def _writeCells(self, cells):
+	cells = blink.process(self, cells)
+	cells = displaylayout.process(cells)
+	origFunc["_writeCells"](self, cells)
+_writeCells.__wrapped__ = origFunc["_writeCells"]
+
+
 # braille.TextInfoRegion.nextLine()
 def nextLine(self):
 	try:
 		dest = self._readingInfo.copy()
-		continue_ = True
-		while continue_:
+		while True:
 			moved = dest.move(self._getReadingUnit(), 1)
 			if not moved:
 				if self.allowPageTurns and isinstance(dest.obj, textInfos.DocumentWithPageTurns):
 					try: dest.obj.turnPage()
 					except RuntimeError as err:
 						log.error(err)
-						continue_ = False
+						break
 					else: dest = dest.obj.makeTextInfo(textInfos.POSITION_FIRST)
 				else: return
-			if config.conf["brailleExtender"]["skipBlankLinesScroll"]:
-				dest_ = dest.copy()
-				dest_.expand(textInfos.UNIT_LINE)
-				continue_ = not dest_.text.strip()
-			else:
-				continue_ = False
+			if not config.conf["brailleExtender"]["skipBlankLinesScroll"]: break
+			dest.collapse()
+			if blanklines.skip(dest, 1) != blanklines.END_REACHED: break
 		dest.collapse()
 		self._setCursor(dest)
-		queueHandler.queueFunction(queueHandler.eventQueue, speech.cancelSpeech)
-		queueHandler.queueFunction(queueHandler.eventQueue, sayCurrentLine)
+		readahead.schedule(self, dest, 1, translateRegion)
+		scheduleSayCurrentLine()
 	except BaseException as err:
 		log.error(err)
 
@@ -190,32 +252,81 @@ def previousLine(self, start=False):
 		dest.collapse()
 		if start: unit = self._getReadingUnit()
 		else: unit = textInfos.UNIT_CHARACTER
-		continue_ = True
-		while continue_:
+		while True:
 			moved = dest.move(unit, -1)
 			if not moved:
 				if self.allowPageTurns and isinstance(dest.obj, textInfos.DocumentWithPageTurns):
 					try: dest.obj.turnPage(previous=True)
 					except RuntimeError as err:
 						log.error(err)
-						continue_ = False
+						break
 					else:
 						dest = dest.obj.makeTextInfo(textInfos.POSITION_LAST)
 						dest.expand(unit)
 				else: return
-			if config.conf["brailleExtender"]["skipBlankLinesScroll"]:
-				dest_ = dest.copy()
-				dest_.expand(textInfos.UNIT_LINE)
-				continue_ = not dest_.text.strip()
-			else:
-				continue_ = False
+			if not config.conf["brailleExtender"]["skipBlankLinesScroll"]: break
+			dest.collapse()
+			res = blanklines.skip(dest, -1)
+			if res == blanklines.END_REACHED: continue
+			if res == blanklines.FOUND and not start:
+				# Show the end of the line, as when moving back by character
+				dest = blanklines.getLine(dest)
+				dest.collapse(end=True)
+				dest.move(textInfos.UNIT_CHARACTER, -1)
+			break
 		dest.collapse()
 		self._setCursor(dest)
-		queueHandler.queueFunction(queueHandler.eventQueue, speech.cancelSpeech)
-		queueHandler.queueFunction(queueHandler.eventQueue, sayCurrentLine)
+		readahead.schedule(self, dest, -1, translateRegion)
+		scheduleSayCurrentLine()
 	except BaseException as err:
 		log.error(err)
 
+# Scripts which don't interrupt speech when executed from a braille display
+NO_STOP_SPEECH_SCRIPTS = frozenset([
+	"script_braille_dots", "script_braille_enter",
+	"script_volumePlus", "script_volumeMinus", "script_toggleVolume",
+	"script_hourDate",
+	"script_ctrl", "script_alt", "script_nvda", "script_win",
+	"script_ctrlAlt", "script_ctrlAltWin", "script_ctrlAltWinShift", "script_ctrlAltShift", "script_ctrlWin", "script_ctrlWinShift", "script_ctrlShift", "script_altWin", "script_altWinShift", "script_altShift", "script_winShift"
+])
+SCROLL_SCRIPTS = frozenset(["script_braille_scrollBack", "script_braille_scrollForward"])
+# Scripts still allowed when the braille keyboard is locked
+LOCK_EXEMPT_SCRIPTS = frozenset(["script_toggleLockBrailleKeyboard"])
+
+_brailleGestureClasses = {}
+_scriptClasses = {}
+_doNotStopSpeechScripts = NO_STOP_SPEECH_SCRIPTS
+_stopSpeechUnknown = True
+
+def refreshGestureClassification():
+	"""Recomputes the gesture classification from the current configuration.
+	Must be called when `stopSpeechScroll` or `stopSpeechUnknown` change.
+	"""
+	global _doNotStopSpeechScripts, _stopSpeechUnknown
+	_doNotStopSpeechScripts = NO_STOP_SPEECH_SCRIPTS
+	if not config.conf["brailleExtender"]["stopSpeechScroll"]:
+		_doNotStopSpeechScripts = _doNotStopSpeechScripts | SCROLL_SCRIPTS
+	_stopSpeechUnknown = config.conf["brailleExtender"]["stopSpeechUnknown"]
+	_scriptClasses.clear()
+
+def classifyGesture(gesture, script):
+	"""Returns a tuple (isBrailleDisplayGesture, lockExempt, stopSpeech) for a gesture and its script.
+	Results are cached by gesture class and script function.
+	"""
+	gestureClass = type(gesture)
+	isBrailleDisplayGesture = _brailleGestureClasses.get(gestureClass)
+	if isBrailleDisplayGesture is None:
+		isBrailleDisplayGesture = _brailleGestureClasses[gestureClass] = "brailleDisplayDrivers" in str(gestureClass)
+	if not isBrailleDisplayGesture: return False, True, True
+	if script is None: return True, False, _stopSpeechUnknown
+	func = getattr(script, "__func__", None)
+	if func is None: return True, False, True
+	res = _scriptClasses.get(func)
+	if res is None:
+		name = func.__name__
+		res = _scriptClasses[func] = (True, name in LOCK_EXEMPT_SCRIPTS, name not in _doNotStopSpeechScripts)
+	return res
+
 # inputCore.InputManager.executeGesture
 def executeGesture(self, gesture):
 		"""Perform the action associated with a gesture.
@@ -230,21 +341,13 @@ def executeGesture(self, gesture):
 			raise NoInputGestureAction
 
 		script = gesture.script
-		if "brailleDisplayDrivers" in str(type(gesture)):
-			if instanceGP.brailleKeyboardLocked and ((hasattr(script, "__func__") and script.__func__.__name__ != "script_toggleLockBrailleKeyboard") or not hasattr(script, "__func__")): return
-			if not config.conf["brailleExtender"]['stopSpeechUnknown'] and gesture.script == None: stopSpeech = False
-			elif hasattr(script, "__func__") and (script.__func__.__name__ in [
-			"script_braille_dots", "script_braille_enter",
-			"script_volumePlus", "script_volumeMinus", "script_toggleVolume",
-			"script_hourDate",
-			"script_ctrl", "script_alt", "script_nvda", "script_win",
-			"script_ctrlAlt", "script_ctrlAltWin", "script_ctrlAltWinShift", "script_ctrlAltShift","script_ctrlWin","script_ctrlWinShift","script_ctrlShift","script_altWin","script_altWinShift","script_altShift","script_winShift"]
-			or (
-				not config.conf["brailleExtender"]['stopSpeechScroll'] and
-			script.__func__.__name__ in ["script_braille_scrollBack","script_braille_scrollForward"])):
-				stopSpeech = False
-			else: stopSpeech = True
-		else: stopSpeech = True
+		isBrailleDisplayGesture, lockExempt, stopSpeech = classifyGesture(gesture, script)
+		if isBrailleDisplayGesture and instanceGP.brailleKeyboardLocked and not lockExempt: return
+		if isBrailleDisplayGesture and getattr(gesture, "routingIndex", None) is not None and not hasattr(gesture, "physicalRoutingIndex"):
+			gesture.physicalRoutingIndex = gesture.routingIndex
+			gesture.routingIndex = displaylayout.toLogicalIndex(gesture.routingIndex)
+			# Dead cell
+			if gesture.routingIndex is None: return
 
 		focus = api.getFocusObject()
 		if focus.sleepMode is focus.SLEEP_FULL or (focus.sleepMode and not getattr(script, 'allowInSleepMode', False)):
@@ -371,11 +474,12 @@ def input_(self, dots):
 		advancedInputStr = ''.join([chr(cell | 0x2800) for cell in self.bufferBraille[:pos]])
 		if advancedInputStr:
 			res = ''
-			abreviations = advancedinput.getReplacements([advancedInputStr])
+			abreviations = advancedinput.getReplacements([advancedInputStr], limit=2)
 			startUnicodeValue = "⠃⠙⠓⠕⠭⡃⡙⡓⡕⡭"
 			if not abreviations and advancedInputStr[0] in startUnicodeValue: advancedInputStr = config.conf["brailleExtender"]["advancedInputMode"]["escapeSignUnicodeValue"] + advancedInputStr
 			lenEscapeSign = len(config.conf["brailleExtender"]["advancedInputMode"]["escapeSignUnicodeValue"])
 			if advancedInputStr == config.conf["brailleExtender"]["advancedInputMode"]["escapeSignUnicodeValue"] or (advancedInputStr.startswith(config.conf["brailleExtender"]["advancedInputMode"]["escapeSignUnicodeValue"]) and len(advancedInputStr) > lenEscapeSign and advancedInputStr[lenEscapeSign] in startUnicodeValue):
+				advancedinput.clearCandidates()
 				equiv = {'⠃': 'b', '⠙': 'd', '⠓': 'h', '⠕': 'o', '⠭': 'x', '⡃': 'B', '⡙': 'D', '⡓': 'H', '⡕': 'O', '⡭': 'X'}
 				if advancedInputStr[-1] == '⠀':
 					text = equiv[advancedInputStr[1]] + louis.backTranslate(getCurrentBrailleTables(True, brf=instanceGP.BRFMode), advancedInputStr[2:-1])[0]
@@ -388,10 +492,18 @@ def input_(self, dots):
 				else: self._reportUntranslated(pos)
 			elif abreviations:
 				if len(abreviations) == 1:
+					advancedinput.clearCandidates()
 					res = abreviations[0].replaceBy
+					advancedinput.recordUsage(abreviations[0])
 					sendChar(res)
-				else: return self._reportUntranslated(pos)
+				else:
+					self._reportUntranslated(pos)
+					if config.conf["brailleExtender"]["advancedInputMode"]["showCandidates"]:
+						advancedinput.showCandidates(advancedinput.getCandidates(advancedInputStr))
+					else: advancedinput.clearCandidates()
+					return
 			else:
+				advancedinput.clearCandidates()
 				res = huc.isValidHUCInput(advancedInputStr)
 				if res == huc.HUC_INPUT_INCOMPLETE: return self._reportUntranslated(pos)
 				if res == huc.HUC_INPUT_INVALID: return badInput(self)
@@ -425,10 +537,18 @@ def input_(self, dots):
 
 def sendChar(char):
 	nvwave.playWaveFile(os.path.join(baseDir, "res/sounds/keyPress.wav"))
-	core.callLater(0, brailleInput.handler.sendChars, char)
+	textsender.send(char)
 	if len(char) == 1:
 		core.callLater(100, speech.speakSpelling, char)
-	else: core.callLater(100, speech.speakMessage, char)
+	else: core.callLater(100, speech.speakMessage, textsender.getSpokenSummary(char))
+
+def selectCandidate(entry):
+	advancedinput.clearCandidates()
+	brailleInput.handler.flushBuffer()
+	advancedinput.recordUsage(entry)
+	sendChar(entry.replaceBy)
+	if config.conf["brailleExtender"]["advancedInputMode"]["stopAfterOneChar"]:
+		instanceGP.advancedInput = False
 
 def badInput(self):
 	nvwave.playWaveFile("waves/textError.wav")
@@ -511,6 +631,7 @@ def _createTablesString(tablesList):
 
 # applying patches
 braille.Region.update = update
+braille.BrailleHandler._writeCells = _writeCells
 braille.TextInfoRegion.previousLine = previousLine
 braille.TextInfoRegion.nextLine = nextLine
 inputCore.InputManager.executeGesture = executeGesture
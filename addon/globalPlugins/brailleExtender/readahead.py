@@ -0,0 +1,211 @@
+# readahead.py
+# Part of BrailleExtender addon for NVDA
+# Copyright 2016-2021 André-Abush CLAUSE, released under GPL.
+# Read-ahead while scrolling: the text with fields of the next reading units is fetched on idle,
+# and translated when it is plain text, so that showing them later costs no round trip to the application.
+# Units are identified by their bookmark, only bookmarks compared by value (offsets) are supported.
+
+from collections import OrderedDict
+
+import braille
+import config
+import core
+import louis
+import textInfos
+from logHandler import log
+
+try: from textInfos.offsets import Offsets
+except ImportError: Offsets = None
+
+# Delay before reading ahead, and between two units (ms)
+IDLE_DELAY = 50
+LINE_ENDINGS = "\r\n\0\v\f"
+
+# (bookmark, format configuration) -> text with fields
+_fields = {}
+# translation key -> (brailleCells, brailleToRawPos, rawToBraillePos)
+_translations = OrderedDict()
+_document = None
+_pending = None
+# Bookmark of the caret left by the last scroll
+_caret = None
+# Returns the format configuration used by the regions, set by the global plugin
+formatConfigFilter = lambda formatConfig: formatConfig
+
+
+def getUnitCount():
+	return config.conf["brailleExtender"]["readAheadUnits"]
+
+
+def invalidate():
+	global _document, _pending, _caret
+	_fields.clear()
+	_translations.clear()
+	_document = _pending = _caret = None
+
+
+def isDocument(obj):
+	return _document and (obj is _document or getattr(obj, "treeInterceptor", None) is _document)
+
+
+def onTextChange(obj):
+	if isDocument(obj): invalidate()
+
+
+def onCaret(obj):
+	"""Drops the units read ahead when the caret moved elsewhere than where scrolling left it."""
+	if not isDocument(obj): return
+	try: caret = _document.makeTextInfo(textInfos.POSITION_CARET)
+	except (NotImplementedError, RuntimeError) as err:
+		log.debug(err)
+		caret = None
+	if caret is None or getBookmark(caret) != _caret: invalidate()
+
+
+def getBookmark(info):
+	try: bookmark = info.bookmark
+	except (NotImplementedError, RuntimeError) as err:
+		log.debug(err)
+		return None
+	if Offsets and isinstance(bookmark, Offsets): return bookmark
+	return None
+
+
+def getFormatConfigSignature(formatConfig):
+	try: return tuple(sorted(formatConfig.copy().items()))
+	except TypeError: return None
+
+
+def getFields(info, formatConfig):
+	"""Returns the text with fields read ahead for `info`, None if it was not read."""
+	if not _fields or info.obj is not _document: return None
+	bookmark = getBookmark(info)
+	if bookmark is None: return None
+	return _fields.pop((bookmark, getFormatConfigSignature(formatConfig)), None)
+
+
+class TextInfoWithFields:
+	"""A text info whose text with fields was read ahead."""
+
+	def __init__(self, info, fields):
+		self._info = info
+		self._fields = fields
+
+	def getTextWithFields(self, formatConfig=None):
+		return self._fields
+
+	def __getattr__(self, name):
+		return getattr(self._info, name)
+
+
+def getTextInfo(info, formatConfig):
+	"""Returns `info`, or a text info giving the text with fields read ahead for it."""
+	fields = getFields(info, formatConfig)
+	return info if fields is None else TextInfoWithFields(info, fields)
+
+
+def getTranslationKey(tables, rawText, typeform, mode, cursorPos, parseUndefinedChars):
+	return (
+		tuple(tables), rawText, tuple(typeform) if typeform else None, mode,
+		cursorPos if mode & louis.compbrlAtCursor else None, parseUndefinedChars
+	)
+
+
+def popTranslation(key):
+	if not _translations: return None
+	return _translations.pop(key, None)
+
+
+class _PreparedRegion:
+	"""The parts of a region needed to translate a reading unit in advance.
+	The cursor is at the start of the unit, as after scrolling.
+	"""
+
+	def __init__(self, region, rawText, rawTextTypeforms):
+		self.rawText = rawText
+		self.rawTextTypeforms = rawTextTypeforms
+		self.parseUndefinedChars = region.parseUndefinedChars
+		self.cursorPos = 0
+		self.brailleCells = self.brailleToRawPos = self.rawToBraillePos = []
+		self.brailleCursorPos = None
+
+
+def getRawText(region, fields, formatConfig):
+	"""Returns the raw text and typeforms the region builds for plain text fields, None if other fields are present."""
+	getTypeform = type(region)._getTypeformFromFormatField
+	texts = []
+	typeforms = []
+	typeform = louis.plain_text
+	for command in fields:
+		if isinstance(command, str):
+			texts.append(command)
+			typeforms.extend((typeform,) * len(command))
+		elif isinstance(command, textInfos.FieldCommand) and command.command == "formatChange":
+			typeform = getTypeform(None, command.field, formatConfig)
+		else: return None
+	rawText = ''.join(texts).rstrip(LINE_ENDINGS)
+	return rawText + braille.TEXT_SEPARATOR, typeforms[:len(rawText)] + [louis.plain_text]
+
+
+def schedule(region, info, direction, translate):
+	"""Reads ahead the units following `info` in `direction` (1 or -1), then translates them with `translate`."""
+	global _document, _pending, _caret
+	bookmark = getBookmark(info)
+	if not getUnitCount() or bookmark is None:
+		_pending = None
+		return
+	if info.obj is not _document:
+		invalidate()
+		_document = info.obj
+	_caret = bookmark
+	request = _pending = _ReadAheadRequest(region, info, direction, translate)
+	core.callLater(IDLE_DELAY, _readAhead, request)
+
+
+class _ReadAheadRequest:
+
+	def __init__(self, region, info, direction, translate):
+		self.region = region
+		self.info = info.copy()
+		self.info.collapse()
+		self.direction = direction
+		self.translate = translate
+		self.count = 0
+		self.fields = {}
+		self.translations = OrderedDict()
+
+
+def _readAhead(request):
+	global _fields, _translations
+	if request is not _pending: return
+	region = request.region
+	formatConfig = formatConfigFilter(config.conf["documentFormatting"])
+	try:
+		unit = region._getReadingUnit()
+		moved = request.info.move(unit, request.direction)
+		if moved:
+			chunk = request.info.copy()
+			chunk.expand(unit)
+			key = (getBookmark(chunk), getFormatConfigSignature(formatConfig))
+			fields = _fields.get(key)
+			if fields is None: fields = _fields[key] = chunk.getTextWithFields(formatConfig)
+			request.fields[key] = fields
+			raw = getRawText(region, fields, formatConfig)
+			if raw:
+				prepared = _PreparedRegion(region, *raw)
+				# A translation already prepared is reused by `translate`
+				translationKey = request.translate(prepared)
+				_translations[translationKey] = request.translations[translationKey] = (
+					prepared.brailleCells, prepared.brailleToRawPos, prepared.rawToBraillePos
+				)
+	except Exception as err:
+		log.debug(err)
+		moved = False
+	request.count += 1
+	if moved and request.count < getUnitCount():
+		core.callLater(IDLE_DELAY, _readAhead, request)
+		return
+	# Units out of the new window are dropped, the caret has moved since they were read.
+	# Units already shown have been removed from the caches meanwhile.
+	_fields = {key: fields for key, fields in request.fields.items() if key in _fields}
+	_translations = OrderedDict((key, value) for key, value in request.translations.items() if key in _translations)
@@ -2,6 +2,10 @@
 # Part of BrailleExtender addon for NVDA
 # Copyright 2016-2020 André-Abush CLAUSE, released under GPL.
 
+from collections import Counter
+
+import braille
+
 
 class BrailleCellReplacement:
 
@@ -42,12 +46,43 @@ def getBraillePosFromRawPos(region, i):
 	end = start + region.brailleToRawPos.count(region.brailleToRawPos[start]) - 1
 	return start, end
 
+def getRawSpans(region):
+	"""Returns for each braille position of `region` the raw (start, end) span of the text shown at this position.
+	The list is cached on the region until it is translated again.
+	"""
+	brailleToRawPos = region.brailleToRawPos
+	cache = getattr(region, "_rawSpans", None)
+	if cache and cache[0] is brailleToRawPos: return cache[1]
+	spans = [None] * len(brailleToRawPos)
+	end = len(region.rawText)
+	i = len(brailleToRawPos) - 1
+	while i >= 0:
+		start = brailleToRawPos[i]
+		span = (start, end if end > start else start + 1)
+		while i >= 0 and brailleToRawPos[i] == start:
+			spans[i] = span
+			i -= 1
+		end = start
+	region._rawSpans = (brailleToRawPos, spans)
+	return spans
+
+def getRawSpanFromWindowPos(windowPos):
+	"""Returns the region and the raw (start, end) span shown at a position of the braille window."""
+	buffer = braille.handler.buffer
+	region, pos = buffer.bufferPosToRegionPos(buffer.windowStartPos + windowPos)
+	return region, getRawSpans(region)[pos]
+
 def streamRegionFromRawText(region):
 	if not region: return None
+	brailleCells = region.brailleCells
+	rawToBraillePos = region.rawToBraillePos
+	brailleToRawPos = region.brailleToRawPos
+	sizes = Counter(brailleToRawPos)
 	for i, rawText in enumerate(region.rawText):
-		startBraillePos, endBraillePos = getBraillePosFromRawPos(region, i)
-		bc = getBrailleCellFromRawPos(region, i)
-		uc = getUnicodeBrailleFromRawPos(region, i)
+		startBraillePos = rawToBraillePos[i]
+		endBraillePos = startBraillePos + sizes[brailleToRawPos[startBraillePos]] - 1
+		bc = brailleCells[startBraillePos:endBraillePos+1]
+		uc = ''.join([chr(x+0x2800) for x in bc])
 		yield i, rawText, startBraillePos, endBraillePos, bc, uc
 
 def findBrailleCellsPattern(region, pattern):
@@ -60,8 +95,8 @@ def replaceBrailleCells(region, replacements):
 	replacements.sort(key=lambda r: (r.start, r.end))
 	replacements = {e.start: e for e in replacements}
 	y = streamRegionFromRawText(region)
-	rawPosDone = []
-	braillePosDone = []
+	rawPosDone = set()
+	braillePosDone = set()
 	newBrailleCells = []
 	newBrailleToRawPos = []
 	newRawToBraillePos = []
@@ -79,17 +114,23 @@ def replaceBrailleCells(region, replacements):
 			if r.start < r.end:
 				newPosDone = [e for e in range(r.start, r.end+1)]
 				szRawText = len(newPosDone)
-				rawPosDone += newPosDone
+				rawPosDone.update(newPosDone)
 		cursorPos = len(newBrailleCells) + szBefore
 		if startBraillePos in braillePosDone:
 			newRawToBraillePos += [newRawToBraillePos[-1]]
+			# The position is inside a contraction already written, the insertions are moved after it
+			if i in replacements:
+				r = replacements[i]
+				uc = r.insertBefore + r.insertAfter
+				newBrailleCells += [ord(c)-0x2800 for c in uc]
+				newBrailleToRawPos += len(uc)*[i]
 			continue
 		newBrailleCells += [ord(c)-0x2800 for c in uc]
 		if addDots: newBrailleCells = [d | addDots for d in newBrailleCells]
 		newBrailleToRawPos += len(uc)*[i]
 		newRawToBraillePos += [cursorPos] * szRawText
 		newPosDone = [e for e in range(startBraillePos, endBraillePos+1)]
-		braillePosDone += newPosDone
+		braillePosDone.update(newPosDone)
 	region.brailleCells = newBrailleCells
 	region.brailleToRawPos = newBrailleToRawPos
 	region.rawToBraillePos = newRawToBraillePos
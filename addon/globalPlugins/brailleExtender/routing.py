@@ -0,0 +1,181 @@
+# routing.py
+# Part of BrailleExtender addon for NVDA
+# Copyright 2016-2021 André-Abush CLAUSE, released under GPL.
+# Routing of the braille cursor with emulated cursor keys (terminals, review mode)
+
+import re
+import time
+
+import braille
+import controlTypes
+import core
+import keyboardHandler
+import queueHandler
+import speech
+import winUser
+import wx
+from logHandler import log
+
+from . import regionhelper
+from .utils import getCurrentChar
+
+# Roles where control+arrow moves the caret to the start of the previous/next word
+WORD_NAVIGATION_ROLES = frozenset([controlTypes.ROLE_EDITABLETEXT])
+RE_WORD_START = re.compile(r"\b\w")
+# Control+arrow also stops at punctuation, with rules depending on the control
+RE_PUNCTUATION = re.compile(r"[^\w\s]")
+VERIFY_DELAY = 30
+MAX_VERIFY_ATTEMPTS = 10
+MAX_CORRECTIONS = 2
+# Time given to the keyboard hook for each batch of injected key events (s)
+INJECTION_DELAY = 0.01
+INJECTION_BATCH = 100
+
+_keyGestures = {}
+_pending = None
+
+
+def getKeyGesture(name):
+	gesture = _keyGestures.get(name)
+	if gesture is None:
+		gesture = _keyGestures[name] = keyboardHandler.KeyboardInputGesture.fromName(name)
+	return gesture
+
+
+def _makeKeyInput(vkCode, scanCode, extended, keyUp):
+	input = winUser.Input()
+	input.type = winUser.INPUT_KEYBOARD
+	input.ii.ki = winUser.KeyBdInput()
+	input.ii.ki.wVk = vkCode
+	input.ii.ki.wScan = scanCode
+	flags = winUser.KEYEVENTF_KEYUP if keyUp else 0
+	if extended: flags |= winUser.KEYEVENTF_EXTENDEDKEY
+	input.ii.ki.dwFlags = flags
+	return input
+
+
+def getBatchedInputs(name, count):
+	"""Returns the inputs needed to press the key `name` `count` times.
+	Modifiers are held down once for the whole run.
+	"""
+	gesture = getKeyGesture(name)
+	modifiers = list(gesture.modifiers)
+	inputs = [_makeKeyInput(vk, 0, ext, False) for vk, ext in modifiers]
+	keyDown = _makeKeyInput(gesture.vkCode, gesture.scanCode, gesture.isExtended, False)
+	keyUp = _makeKeyInput(gesture.vkCode, gesture.scanCode, gesture.isExtended, True)
+	inputs += [keyDown, keyUp] * count
+	inputs += [_makeKeyInput(vk, 0, ext, True) for vk, ext in reversed(modifiers)]
+	return inputs
+
+
+def sendKeys(keys):
+	"""Sends a sequence of (keyName, count) runs, in one call when NVDA can ignore the injected keys."""
+	if not hasattr(keyboardHandler, "ignoreInjection"):
+		# Only the keys sent by KeyboardInputGesture.send are ignored by NVDA
+		for name, count in keys:
+			gesture = getKeyGesture(name)
+			for i in range(count): gesture.send()
+		return
+	inputs = []
+	for name, count in keys:
+		if count > 0: inputs += getBatchedInputs(name, count)
+	if not inputs: return
+	with keyboardHandler.ignoreInjection():
+		winUser.SendInput(inputs)
+		# As KeyboardInputGesture.send, wait until the hook has seen the keys before injection is handled again
+		time.sleep(INJECTION_DELAY * (1 + len(inputs) // INJECTION_BATCH))
+		if not queueHandler.isPendingItems(queueHandler.eventQueue): wx.Yield()
+
+
+def getRegionRawPos(windowPos):
+	"""Returns the region and the raw position for a position in the braille window."""
+	region, (start, end) = regionhelper.getRawSpanFromWindowPos(windowPos)
+	return region, start
+
+
+def planKeys(rawText, start, target, useWords):
+	"""Returns the (keyName, count) runs to move the caret from `start` to `target` in `rawText`.
+	Words are only used when the text crossed has no punctuation, as the stops of control+arrow are only
+	predictable between words separated by spaces.
+	"""
+	if start == target: return []
+	forward = target > start
+	words = 0
+	landing = start
+	if useWords and rawText and not RE_PUNCTUATION.search(rawText, min(start, target), max(start, target) + 1):
+		if forward:
+			wordStarts = [m.start() for m in RE_WORD_START.finditer(rawText, start + 1, target + 1)]
+			if wordStarts: landing = wordStarts[-1]
+		else:
+			wordStarts = [m.start() for m in RE_WORD_START.finditer(rawText, target, start)]
+			if wordStarts: landing = wordStarts[0]
+		words = len(wordStarts)
+	chars = target - landing
+	keys = []
+	if words: keys.append(("control+rightarrow" if forward else "control+leftarrow", words))
+	if chars: keys.append(("rightarrow" if chars > 0 else "leftarrow", abs(chars)))
+	return keys
+
+
+class _RoutingRequest:
+
+	def __init__(self, region, target, speechMode):
+		self.region = region
+		self.rawText = region.rawText if region else None
+		self.target = target
+		self.speechMode = speechMode
+		self.attempts = 0
+		self.corrections = 0
+
+
+def routeWithCursorKeys(obj, routingIndex):
+	"""Moves the caret to the cell `routingIndex` of the current window.
+	Keys are sent as a single batched input, then the final position is verified
+	and corrected if needed.
+	"""
+	global _pending
+	if _pending: _finish(_pending, False)
+	handler = braille.handler
+	region = target = None
+	try:
+		region, start = getRegionRawPos(handler._cursorPos)
+		targetRegion, target = getRegionRawPos(routingIndex)
+		if targetRegion is not region: raise LookupError("not in the same region")
+		keys = planKeys(region.rawText, start, target, obj.role in WORD_NAVIGATION_ROLES)
+	except (LookupError, AttributeError) as err:
+		log.debug(err)
+		region = None
+		nb = handler._cursorPos - routingIndex
+		keys = [("leftarrow" if nb > 0 else "rightarrow", abs(nb))]
+	request = _RoutingRequest(region, target, speech.speechMode)
+	speech.speechMode = speech.speechMode_off
+	sendKeys(keys)
+	_pending = request
+	core.callLater(VERIFY_DELAY, _verify, request)
+
+
+def _verify(request):
+	if request is not _pending: return
+	request.attempts += 1
+	if queueHandler.isPendingItems(queueHandler.eventQueue) and request.attempts < MAX_VERIFY_ATTEMPTS:
+		core.callLater(VERIFY_DELAY, _verify, request)
+		return
+	region = request.region
+	if (
+		region and region.cursorPos is not None and region.rawText == request.rawText
+		and request.corrections < MAX_CORRECTIONS
+	):
+		diff = request.target - region.cursorPos
+		if diff:
+			request.corrections += 1
+			sendKeys([("rightarrow" if diff > 0 else "leftarrow", abs(diff))])
+			core.callLater(VERIFY_DELAY, _verify, request)
+			return
+	_finish(request)
+
+
+def _finish(request, speak=True):
+	global _pending
+	_pending = None
+	speech.speechMode = request.speechMode
+	if speak: speech.speakSpelling(getCurrentChar())
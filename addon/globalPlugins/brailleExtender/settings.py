@@ -21,6 +21,8 @@ import wx
 from logHandler import log
 
 from . import addoncfg
+from . import displaylayout
+from . import patches
 from . import utils
 from .advancedinput import SettingsDlg as AdvancedInputModeDlg
 from .common import addonName, baseDir, punctuationSeparator
@@ -68,6 +70,15 @@ class GeneralDlg(gui.settingsDialogs.SettingsPanel):
 		# Translators: label of a dialog.
 		self.skipBlankLinesScroll = sHelper.addItem(wx.CheckBox(self, label=_("S&kip blank lines during text scrolling")))
 		self.skipBlankLinesScroll.SetValue(config.conf["brailleExtender"]["skipBlankLinesScroll"])
+		# Translators: label of a dialog.
+		self.skipBlankLinesMax = sHelper.addLabeledControl(_("&Maximum number of blank lines skipped at once:"), gui.nvdaControls.SelectOnFocusSpinCtrl, min=1, max=100000, initial=config.conf["brailleExtender"]["skipBlankLinesMax"])
+		# Translators: label of a dialog.
+		self.skipBlankLinesTimeout = sHelper.addLabeledControl(_("Maximum &checking time for blank lines (ms):"), gui.nvdaControls.SelectOnFocusSpinCtrl, min=10, max=5000, initial=config.conf["brailleExtender"]["skipBlankLinesTimeout"])
+		# Translators: label of a dialog.
+		self.readAheadUnits = sHelper.addLabeledControl(_("Lines prepared a&head while scrolling (0 to disable):"), gui.nvdaControls.SelectOnFocusSpinCtrl, min=0, max=20, initial=config.conf["brailleExtender"]["readAheadUnits"])
+		# Translators: label of a dialog.
+		self.outlineIndex = sHelper.addItem(wx.CheckBox(self, label=_("Inde&x the elements of web pages for the rotor")))
+		self.outlineIndex.SetValue(config.conf["brailleExtender"]["outlineIndex"])
 
 		# Translators: label of a dialog.
 		self.smartCapsLock = sHelper.addItem(wx.CheckBox(self, label=_("Smart Caps Loc&k")))
@@ -111,7 +122,18 @@ class GeneralDlg(gui.settingsDialogs.SettingsPanel):
 
 		# Translators: label of a dialog.
 		self.modifierKeysFeedback.SetSelection(itemToSelect)
-		self.rightMarginCells = sHelper.addLabeledControl(_("&Right margin on cells for the active braille display"), gui.nvdaControls.SelectOnFocusSpinCtrl, min=0, max=100, initial=int(config.conf["brailleExtender"]["rightMarginCells_%s" % addoncfg.curBD]))
+		# Translators: label of a dialog.
+		self.leftMarginCells = sHelper.addLabeledControl(_("&Left margin on cells for the active braille display"), gui.nvdaControls.SelectOnFocusSpinCtrl, min=0, max=80, initial=int(config.conf["brailleExtender"]["leftMarginCells_%s" % addoncfg.curBD]))
+		self.rightMarginCells = sHelper.addLabeledControl(_("&Right margin on cells for the active braille display"), gui.nvdaControls.SelectOnFocusSpinCtrl, min=0, max=80, initial=int(config.conf["brailleExtender"]["rightMarginCells_%s" % addoncfg.curBD]))
+		# Translators: label of a dialog.
+		self.deadCells = sHelper.addLabeledControl(_("Cells not &working on the active braille display (for example: 3, 17):"), wx.TextCtrl, value=config.conf["brailleExtender"]["deadCells_%s" % addoncfg.curBD])
+		# Translators: label of a dialog.
+		self.deadDots = sHelper.addLabeledControl(_("Dots not workin&g on the active braille display (cell:dots, * for all cells, for example: 5:78 *:8):"), wx.TextCtrl, value=config.conf["brailleExtender"]["deadDots_%s" % addoncfg.curBD])
+		# Translators: label of a dialog.
+		self.deadDotsReplacements = sHelper.addLabeledControl(_("Dots shown instead of dots not working (dot:replacement, for example: 1:7 4:8, lost dots are hidden if empty):"), wx.TextCtrl, value=config.conf["brailleExtender"]["deadDotsReplacements_%s" % addoncfg.curBD])
+		# Translators: label of a dialog.
+		self.rightToLeft = sHelper.addItem(wx.CheckBox(self, label=_("Read the braille display from right to le&ft")))
+		self.rightToLeft.SetValue(config.conf["brailleExtender"]["rightToLeft"])
 		if addoncfg.gesturesFileExists:
 			lb = [k for k in instanceGP.getKeyboardLayouts()]
 			# Translators: label of a dialog.
@@ -124,6 +146,11 @@ class GeneralDlg(gui.settingsDialogs.SettingsPanel):
 
 		# Translators: label of a dialog.
 		self.autoScrollDelay = sHelper.addLabeledControl(_("Autoscroll &delay for the active braille display (ms):"), gui.nvdaControls.SelectOnFocusSpinCtrl, min=125, max=42000, initial=int(config.conf["brailleExtender"]["autoScrollDelay_%s" % addoncfg.curBD]))
+		# Translators: label of a dialog.
+		self.autoScrollAdaptive = sHelper.addItem(wx.CheckBox(self, label=_("Adapt autoscroll d&elay to the content of the braille display")))
+		self.autoScrollAdaptive.SetValue(config.conf["brailleExtender"]["autoScrollAdaptive"])
+		# Translators: label of a dialog.
+		self.autoScrollRate = sHelper.addLabeledControl(_("Reading rate for adapted autoscroll dela&ys (cells per minute):"), gui.nvdaControls.SelectOnFocusSpinCtrl, min=20, max=6000, initial=config.conf["brailleExtender"]["autoScrollRate"])
 		self.brailleDisplay1 = sHelper.addLabeledControl(_("Preferred &primary braille display:"), wx.Choice, choices=self.bds_v)
 		self.brailleDisplay1.SetSelection(self.bds_k.index(config.conf["brailleExtender"]["brailleDisplay1"]))
 		self.brailleDisplay2 = sHelper.addLabeledControl(_("Preferred &secondary braille display:"), wx.Choice, choices=self.bds_v)
@@ -140,16 +167,29 @@ class GeneralDlg(gui.settingsDialogs.SettingsPanel):
 		config.conf["brailleExtender"]["reverseScrollBtns"] = self.reverseScrollBtns.IsChecked()
 		config.conf["brailleExtender"]["stopSpeechScroll"] = self.stopSpeechScroll.IsChecked()
 		config.conf["brailleExtender"]["skipBlankLinesScroll"] = self.skipBlankLinesScroll.IsChecked()
+		config.conf["brailleExtender"]["skipBlankLinesMax"] = self.skipBlankLinesMax.Value
+		config.conf["brailleExtender"]["skipBlankLinesTimeout"] = self.skipBlankLinesTimeout.Value
+		config.conf["brailleExtender"]["readAheadUnits"] = self.readAheadUnits.Value
+		config.conf["brailleExtender"]["outlineIndex"] = self.outlineIndex.IsChecked()
 		config.conf["brailleExtender"]["smartCapsLock"] = self.smartCapsLock.IsChecked()
 		config.conf["brailleExtender"]["stopSpeechUnknown"] = self.stopSpeechUnknown.IsChecked()
 		config.conf["brailleExtender"]["speakRoutingTo"] = self.speakRoutingTo.IsChecked()
 		config.conf["brailleExtender"]["routingReviewModeWithCursorKeys"] = self.routingReviewModeWithCursorKeys.IsChecked()
+		patches.refreshGestureClassification()
 
 		config.conf["brailleExtender"]["updateChannel"] = list(addoncfg.updateChannels.keys())[self.updateChannel.GetSelection()]
 		config.conf["brailleExtender"]["speakScroll"] = list(addoncfg.focusOrReviewChoices.keys())[self.speakScroll.GetSelection()]
 
 		config.conf["brailleExtender"]["autoScrollDelay_%s" % addoncfg.curBD] = self.autoScrollDelay.Value
+		config.conf["brailleExtender"]["autoScrollAdaptive"] = self.autoScrollAdaptive.IsChecked()
+		config.conf["brailleExtender"]["autoScrollRate"] = self.autoScrollRate.Value
+		config.conf["brailleExtender"]["leftMarginCells_%s" % addoncfg.curBD] = self.leftMarginCells.Value
 		config.conf["brailleExtender"]["rightMarginCells_%s" % addoncfg.curBD] = self.rightMarginCells.Value
+		config.conf["brailleExtender"]["deadCells_%s" % addoncfg.curBD] = self.deadCells.Value
+		config.conf["brailleExtender"]["deadDots_%s" % addoncfg.curBD] = self.deadDots.Value
+		config.conf["brailleExtender"]["deadDotsReplacements_%s" % addoncfg.curBD] = self.deadDotsReplacements.Value
+		config.conf["brailleExtender"]["rightToLeft"] = self.rightToLeft.IsChecked()
+		displaylayout.refresh()
 		config.conf["brailleExtender"]["brailleDisplay1"] = self.bds_k[self.brailleDisplay1.GetSelection()]
 		config.conf["brailleExtender"]["brailleDisplay2"] = self.bds_k[self.brailleDisplay2.GetSelection()]
 		if addoncfg.gesturesFileExists:
@@ -183,6 +223,13 @@ class AttribraDlg(gui.settingsDialogs.SettingsPanel):
 		self.subAttribute.SetSelection(self.getItemToSelect("text-position:sub"))
 		self.superAttribute = sHelper.addLabeledControl(_("Su&perscripts:"), wx.Choice, choices=addoncfg.attributeChoicesValues)
 		self.superAttribute.SetSelection(self.getItemToSelect("text-position:super"))
+		self.attributesTags = sHelper.addItem(wx.CheckBox(self, label=_("Show text attributes with ta&gs instead of dots")))
+		self.attributesTags.SetValue(config.conf["brailleExtender"]["attributesTags"])
+		self.formattingChanges = sHelper.addItem(wx.CheckBox(self, label=_("Report only formatting &changes")))
+		self.formattingChanges.SetValue(config.conf["brailleExtender"]["formattingChanges"])
+		self.blinkAttributes = sHelper.addItem(wx.CheckBox(self, label=_("B&link the dots marking text attributes")))
+		self.blinkAttributes.SetValue(config.conf["brailleExtender"]["blinkAttributes"])
+		self.blinkAttributesRate = sHelper.addLabeledControl(_("Blink i&nterval (ms):"), gui.nvdaControls.SelectOnFocusSpinCtrl, min=100, max=5000, initial=config.conf["brailleExtender"]["blinkAttributesRate"])
 
 	def postInit(self): self.toggleAttribra.SetFocus()
 
@@ -196,6 +243,11 @@ class AttribraDlg(gui.settingsDialogs.SettingsPanel):
 		config.conf["brailleExtender"]["attributes"]["strikethrough"] = addoncfg.attributeChoicesKeys[self.strikethroughAttribute.GetSelection()]
 		config.conf["brailleExtender"]["attributes"]["text-position:sub"] = addoncfg.attributeChoicesKeys[self.subAttribute.GetSelection()]
 		config.conf["brailleExtender"]["attributes"]["text-position:super"] = addoncfg.attributeChoicesKeys[self.superAttribute.GetSelection()]
+		config.conf["brailleExtender"]["attributesTags"] = self.attributesTags.IsChecked()
+		config.conf["brailleExtender"]["formattingChanges"] = self.formattingChanges.IsChecked()
+		config.conf["brailleExtender"]["blinkAttributes"] = self.blinkAttributes.IsChecked()
+		config.conf["brailleExtender"]["blinkAttributesRate"] = self.blinkAttributesRate.Value
+		instanceGP.onAttributesChange()
 
 	@staticmethod
 	def getItemToSelect(attribute):
@@ -0,0 +1,246 @@
+# textposition.py
+# Part of BrailleExtender addon for NVDA
+# Copyright 2016-2021 André-Abush CLAUSE, released under GPL.
+# Position of the caret in a document without transferring the whole text.
+# Offsets are used directly when the TextInfo exposes them. Otherwise paragraphs are counted
+# in bounded steps and their cumulative offsets are kept, then counted again from the first
+# changed paragraph when the document changes.
+
+import time
+
+import api
+import core
+import textInfos
+from logHandler import log
+
+try: from textInfos.offsets import OffsetsTextInfo
+except ImportError: OffsetsTextInfo = None
+
+# Maximal time spent counting paragraphs in a row (s)
+SCAN_BUDGET = 0.05
+# Delay between two counting steps (ms)
+SCAN_DELAY = 10
+# Maximal number of paragraphs moved over to estimate the position
+ESTIMATE_MAX_PARAGRAPHS = 100000
+# Number of paragraphs moved over at once, and maximal time spent moving, to estimate the position (s)
+ESTIMATE_STEP = 500
+ESTIMATE_BUDGET = 0.05
+
+_revision = 0
+_scan = None
+
+
+def getDocument():
+	obj = api.getFocusObject()
+	treeInterceptor = obj.treeInterceptor
+	if hasattr(treeInterceptor, "TextInfo") and not treeInterceptor.passThrough: obj = treeInterceptor
+	return obj
+
+
+def invalidate(obj=None):
+	"""Must be called when the text of `obj` changes. Paragraph offsets of the focused or counted document are then recounted.
+	The text is taken to change at the caret of the focused document. Otherwise, or if the caret is unknown, all paragraphs are recounted.
+	"""
+	global _revision
+	focus = api.getFocusObject()
+	if obj is None or obj is focus: _revision += 1
+	elif _scan and (obj is _scan.document or getattr(obj, "treeInterceptor", None) is _scan.document): _revision += 1
+	else: return
+	if not _scan: return
+	index = 0
+	if obj is focus and _scan.document is getDocument():
+		try: index = max(0, _scan.find(_scan.document.makeTextInfo(textInfos.POSITION_CARET)))
+		except Exception as err: log.debug(err)
+	_scan.changedFrom = index if _scan.changedFrom is None else min(_scan.changedFrom, index)
+
+
+def getDirectOffsets(info):
+	"""Returns (caret offset, story length) when the TextInfo exposes them, None otherwise."""
+	if OffsetsTextInfo and isinstance(info, OffsetsTextInfo):
+		return info._startOffset, info._getStoryLength()
+	# Microsoft Word object model
+	rangeObj = getattr(info, "_rangeObj", None)
+	if rangeObj is not None:
+		return rangeObj.Start, rangeObj.StoryLength
+	return None
+
+
+class _Scan:
+	"""Cumulative offsets of the paragraphs of a document, counted in bounded steps.
+	Paragraphs are kept as bookmarks, TextInfos are only made from them when comparing positions.
+	"""
+
+	def __init__(self, document, revision):
+		self.document = document
+		self.revision = revision
+		self.bookmarks = []
+		self.starts = []
+		self.total = 0
+		self.complete = False
+		self.lastIndex = 0
+		# Index of the first paragraph changed since the last count, None if it is unknown
+		self.changedFrom = None
+		self.callbacks = []
+		self.scheduled = False
+		self._next = document.makeTextInfo(textInfos.POSITION_FIRST)
+		self._next.collapse()
+
+	def step(self, budget=SCAN_BUDGET):
+		deadline = time.time() + budget
+		info = self._next
+		while not self.complete and time.time() < deadline:
+			paragraph = info.copy()
+			paragraph.expand(textInfos.UNIT_PARAGRAPH)
+			self.bookmarks.append(paragraph.bookmark)
+			self.starts.append(self.total)
+			self.total += len(paragraph.text or '')
+			info = paragraph.copy()
+			info.collapse()
+			if not info.move(textInfos.UNIT_PARAGRAPH, 1) or info.compareEndPoints(paragraph, "startToStart") <= 0:
+				self.complete = True
+		self._next = info
+		return self.complete
+
+	def _paragraph(self, i):
+		return self.document.makeTextInfo(self.bookmarks[i])
+
+	def _contains(self, i, caret):
+		if self._paragraph(i).compareEndPoints(caret, "startToStart") > 0: return False
+		return i + 1 == len(self.bookmarks) or self._paragraph(i + 1).compareEndPoints(caret, "startToStart") > 0
+
+	def find(self, caret):
+		"""Returns the index of the last paragraph starting at or before `caret`, -1 if there is none."""
+		count = len(self.bookmarks)
+		# The caret usually stays in the same paragraph or moves to a neighbour
+		for i in (self.lastIndex, self.lastIndex + 1, self.lastIndex - 1):
+			if 0 <= i < count and self._contains(i, caret): return i
+		lo, hi = 0, count
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if self._paragraph(mid).compareEndPoints(caret, "startToStart") <= 0: lo = mid + 1
+			else: hi = mid
+		return lo - 1
+
+	def restart(self, revision):
+		"""Counts the paragraphs again from the first changed one, the paragraphs before it are kept.
+		Returns False if they must be counted again as well, or if the first changed paragraph is unknown.
+		"""
+		index = self.changedFrom
+		if not index or index >= len(self.bookmarks): return False
+		# The paragraph before the changes must be unchanged
+		previous = self._paragraph(index - 1)
+		previous.collapse()
+		previous.expand(textInfos.UNIT_PARAGRAPH)
+		if len(previous.text or '') != self.starts[index] - self.starts[index - 1]: return False
+		info = previous.copy()
+		info.collapse()
+		self.total = self.starts[index]
+		del self.bookmarks[index:]
+		del self.starts[index:]
+		self.lastIndex = min(self.lastIndex, index - 1)
+		self.revision = revision
+		self.changedFrom = None
+		self.complete = not info.move(textInfos.UNIT_PARAGRAPH, 1) or info.compareEndPoints(previous, "startToStart") <= 0
+		self._next = info
+		return True
+
+	def locate(self, caret):
+		"""Returns the offset of `caret`, None if it is beyond the paragraphs counted so far."""
+		count = len(self.bookmarks)
+		if not count: return None
+		index = self.find(caret)
+		if index < 0: return None
+		before = self._paragraph(index)
+		if index + 1 == count and not self.complete and before.compareEndPoints(caret, "endToStart") < 0:
+			return None
+		self.lastIndex = index
+		before.setEndPoint(caret, "endToStart")
+		return self.starts[index] + len(before.text or '')
+
+
+def countParagraphs(caret, direction, deadline):
+	"""Returns the number of paragraphs from `caret` in `direction` (1 or -1).
+	Counting stops after ESTIMATE_MAX_PARAGRAPHS paragraphs or at `deadline`, the result is then a lower bound.
+	"""
+	info = caret.copy()
+	info.collapse()
+	count = 0
+	while count < ESTIMATE_MAX_PARAGRAPHS:
+		moved = abs(info.move(textInfos.UNIT_PARAGRAPH, ESTIMATE_STEP * direction))
+		count += moved
+		if moved < ESTIMATE_STEP or time.time() >= deadline: break
+	return count
+
+
+def estimatePosition(caret, scan):
+	"""Returns an estimate (caret position, total, False) from the number of paragraphs around the caret,
+	and the mean size of the paragraphs counted so far. Returns None if paragraphs can't be moved over.
+	"""
+	try:
+		countBefore = countParagraphs(caret, -1, time.time() + ESTIMATE_BUDGET / 2)
+		countAfter = countParagraphs(caret, 1, time.time() + ESTIMATE_BUDGET / 2)
+	except Exception as err:
+		log.debug(err)
+		return None
+	size = scan.total / len(scan.bookmarks) if scan.bookmarks else 1
+	return round(countBefore * size), round((countBefore + countAfter + 1) * size), False
+
+
+def getPosition(onExact=None):
+	"""Returns (caret position, total, exact) for the focused document, None if it can't be estimated yet.
+	The position is (0, 0) when the document has no text or when it can't be computed.
+	If the position is not exact, counting continues in the background
+	and `onExact` is called with the exact caret position and total when it is done.
+	"""
+	global _scan
+	document = getDocument()
+	try:
+		caret = document.makeTextInfo(textInfos.POSITION_CARET)
+		offsets = getDirectOffsets(caret)
+		if offsets: return offsets + (True,)
+		scan = _scan if _scan and _scan.document is document else None
+		estimate = None
+		if scan and scan.revision != _revision:
+			# Offsets counted before the last change still give an estimate
+			if scan.complete:
+				pos = scan.locate(caret)
+				if pos is not None: estimate = (pos, max(pos, scan.total), False)
+			# The paragraphs before the first changed one are not counted again
+			if not scan.restart(_revision): scan = None
+		if not scan:
+			scan = _scan = _Scan(document, _revision)
+			if not estimate: scan.step()
+		if scan.complete:
+			pos = scan.locate(caret)
+			if pos is None: return 0, 0, True
+			return pos, scan.total, True
+	except Exception as err:
+		log.debug(err)
+		return 0, 0, True
+	if onExact and onExact not in scan.callbacks: scan.callbacks.append(onExact)
+	_schedule(scan)
+	return estimate or estimatePosition(caret, scan)
+
+
+def _schedule(scan):
+	if scan.scheduled: return
+	scan.scheduled = True
+	core.callLater(SCAN_DELAY, _continueScan, scan)
+
+
+def _continueScan(scan):
+	scan.scheduled = False
+	if scan is not _scan or scan.revision != _revision: return
+	try:
+		if not scan.step():
+			_schedule(scan)
+			return
+		callbacks = scan.callbacks
+		scan.callbacks = []
+		if not callbacks or getDocument() is not scan.document: return
+		pos = scan.locate(scan.document.makeTextInfo(textInfos.POSITION_CARET))
+	except Exception as err:
+		log.debug(err)
+		return
+	if pos is None: return
+	for callback in callbacks: callback(pos, scan.total)
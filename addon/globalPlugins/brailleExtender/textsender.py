@@ -0,0 +1,73 @@
+# textsender.py
+# Part of BrailleExtender addon for NVDA
+# Copyright 2016-2021 André-Abush CLAUSE, released under GPL.
+# Sends long texts to the system in paced chunks, letting NVDA handle its events between them
+
+from collections import deque
+
+import addonHandler
+import brailleInput
+import config
+import core
+
+addonHandler.initTranslation()
+
+CHUNK_SIZE = 128
+# Minimal delay between two chunks (ms)
+MIN_CHUNK_DELAY = 10
+# Texts longer than this are summarized in spoken feedback
+SUMMARY_THRESHOLD = 160
+SUMMARY_SIZE = 48
+
+_chunks = deque()
+_running = False
+
+
+def getChunkDelay(size):
+	rate = config.conf["brailleExtender"]["advancedInputMode"]["sendRateLimit"]
+	if not rate:
+		return MIN_CHUNK_DELAY
+	return max(MIN_CHUNK_DELAY, int(1000 * size / rate))
+
+
+def getChunkSize():
+	rate = config.conf["brailleExtender"]["advancedInputMode"]["sendRateLimit"]
+	# With a rate limit, send a chunk about every 100 ms
+	if rate: return max(1, min(CHUNK_SIZE, rate // 10))
+	return CHUNK_SIZE
+
+
+def send(text):
+	"""Queues `text` to be sent to the system."""
+	global _running
+	size = getChunkSize()
+	_chunks.extend(text[i:i + size] for i in range(0, len(text), size))
+	if not _running and _chunks:
+		_running = True
+		core.callLater(0, _sendNextChunk)
+
+
+def _sendNextChunk():
+	global _running
+	if not _chunks:
+		_running = False
+		return
+	chunk = _chunks.popleft()
+	brailleInput.handler.sendChars(chunk)
+	if _chunks: core.callLater(getChunkDelay(len(chunk)), _sendNextChunk)
+	else: _running = False
+
+
+def cancel():
+	_chunks.clear()
+
+
+def isSending():
+	return _running
+
+
+def getSpokenSummary(text):
+	"""Returns what should be spoken after sending `text`."""
+	if len(text) <= SUMMARY_THRESHOLD:
+		return text
+	return _("{start}… ({size} characters)").format(start=text[:SUMMARY_SIZE], size=len(text))
@@ -229,35 +229,6 @@ def beautifulSht(t, curBD="noBraille", model=True, sep=" / "):
 		out.append(_('{gesture} on {brailleDisplay}').format(gesture=gesture, brailleDisplay=mdl) if mdl != '' else gesture)
 	return out if not sep else sep.join(out)
 
-def getText():
-	obj = api.getFocusObject()
-	treeInterceptor = obj.treeInterceptor
-	if hasattr(
-			treeInterceptor,
-			'TextInfo') and not treeInterceptor.passThrough:
-		obj = treeInterceptor
-	try:
-		info = obj.makeTextInfo(textInfos.POSITION_ALL)
-		return info.text
-	except BaseException:
-		pass
-	return None
-
-
-def getTextCarret():
-	obj = api.getFocusObject()
-	treeInterceptor = obj.treeInterceptor
-	if hasattr(treeInterceptor, 'TextInfo') and not treeInterceptor.passThrough: obj = treeInterceptor
-	try:
-		p1 = obj.makeTextInfo(textInfos.POSITION_ALL)
-		p2 = obj.makeTextInfo(textInfos.POSITION_CARET)
-		p1.setEndPoint(p2, "endToStart")
-		try: return p1.text
-		except BaseException: return None
-	except BaseException: pass
-	return None
-
-
 def getLine():
 	info = api.getReviewPosition().copy()
 	info.expand(textInfos.UNIT_LINE)
@@ -288,14 +259,6 @@ def isEnd():
 	except BaseException: pass
 	return False
 
-def getTextPosition():
-	try:
-		total = len(getText())
-		return len(getTextCarret()), total
-	except BaseException:
-		return 0, 0
-
-
 def uncapitalize(s): return s[:1].lower() + s[1:] if s else ''
 
 
@@ -0,0 +1,227 @@
+# virtualsettings.py
+# Part of BrailleExtender addon for NVDA
+# Copyright 2016-2021 André-Abush CLAUSE, released under GPL.
+# Virtual settings: options of the add-on changed from the braille display.
+# The options are a flat model computed once from the configuration specification.
+# Changes are kept aside and written at once when the mode is closed.
+
+import re
+
+import addonHandler
+import config
+
+from . import addoncfg
+from .onehand import INPUT_METHODS
+
+addonHandler.initTranslation()
+
+RE_SPEC = re.compile(r"^\s*(\w+)\s*\((.*)\)\s*$")
+RE_KEYWORD = re.compile(r"^\s*(\w+)\s*=\s*(.*?)\s*$")
+# Steps of the integer options by path, 1 if missing
+INTEGER_STEPS = {
+	("autoScrollDelay",): 25,
+	("autoScrollRate",): 20,
+	("skipBlankLinesMax",): 10,
+	("skipBlankLinesTimeout",): 10,
+	("blinkAttributesRate",): 50,
+	("advancedInputMode", "sendRateLimit"): 10,
+}
+# Options which need NVDA to be restarted
+EXCLUDED = frozenset([("tabSpace",)])
+
+# Labels of the options by path, without the suffix of the braille display
+LABELS = {
+	("autoCheckUpdate",): _("Automatically check for updates"),
+	("updateChannel",): _("Update channel"),
+	("speakScroll",): _("Say current line while scrolling in"),
+	("stopSpeechScroll",): _("Speech interrupt when scrolling on same line"),
+	("smartDelayScroll",): _("Smart delay when scrolling"),
+	("ignoreBlankLineScroll",): _("Ignore blank lines when scrolling"),
+	("skipBlankLinesScroll",): _("Skip blank lines during text scrolling"),
+	("skipBlankLinesMax",): _("Maximum number of blank lines skipped at once"),
+	("skipBlankLinesTimeout",): _("Maximum checking time for blank lines (ms)"),
+	("readAheadUnits",): _("Lines prepared ahead while scrolling"),
+	("outlineIndex",): _("Index the elements of web pages for the rotor"),
+	("smartCapsLock",): _("Smart Caps Lock"),
+	("stopSpeechUnknown",): _("Speech interrupt for unknown gestures"),
+	("speakRoutingTo",): _("Announce character when routing braille cursor"),
+	("routingReviewModeWithCursorKeys",): _("Use cursor keys to route cursor in review mode"),
+	("hourDynamic",): _("Display time and date infinitely"),
+	("reviewModeTerminal",): _("Automatically switch to review mode in terminal windows"),
+	("volumeChangeFeedback",): _("Announce volume changes"),
+	("modifierKeysFeedback",): _("Announce modifier key presses"),
+	("beepsModifiers",): _("Play beeps for modifier keys"),
+	("leftMarginCells",): _("Left margin on cells"),
+	("rightMarginCells",): _("Right margin on cells"),
+	("rightToLeft",): _("Read the braille display from right to left"),
+	("reverseScrollBtns",): _("Reverse forward and back scroll buttons"),
+	("autoScrollDelay",): _("Autoscroll delay (ms)"),
+	("autoScrollAdaptive",): _("Adapt autoscroll delay to the content"),
+	("autoScrollRate",): _("Reading rate for adapted autoscroll delays (cells per minute)"),
+	("tabSpace",): _("Display tabs as spaces"),
+	("tabSize",): _("Spaces per tab"),
+	("features", "attributes"): _("Indicate text attributes in braille with Attribra"),
+	("features", "roleLabels"): _("Use custom braille role labels"),
+	("attributes", "selectedElement"): _("Selected elements"),
+	("attributes", "invalid-spelling"): _("Spelling errors"),
+	("attributes", "bold"): _("Bold"),
+	("attributes", "italic"): _("Italic"),
+	("attributes", "underline"): _("Underline"),
+	("attributes", "strikethrough"): _("Strikethrough"),
+	("attributes", "text-position:sub"): _("Subscripts"),
+	("attributes", "text-position:super"): _("Superscripts"),
+	("attributesTags",): _("Show text attributes with tags instead of dots"),
+	("formattingChanges",): _("Report only formatting changes"),
+	("blinkAttributes",): _("Blink the dots marking text attributes"),
+	("blinkAttributesRate",): _("Blink interval (ms)"),
+	("undefinedCharsRepr", "desc"): _("Show punctuation/symbol name for undefined characters"),
+	("undefinedCharsRepr", "extendedDesc"): _("Also describe extended characters"),
+	("undefinedCharsRepr", "fullExtendedDesc"): _("Full extended description"),
+	("undefinedCharsRepr", "showSize"): _("Show the size taken"),
+	("advancedInputMode", "stopAfterOneChar"): _("Exit the advanced input mode after typing one pattern"),
+	("advancedInputMode", "showCandidates"): _("Show completion candidates"),
+	("advancedInputMode", "maxCandidates"): _("Maximum number of candidates"),
+	("advancedInputMode", "sendRateLimit"): _("Rate limit when typing replacements (characters per second)"),
+	("oneHandedMode", "enabled"): _("One-handed mode"),
+	("oneHandedMode", "inputMethod"): _("Input method"),
+}
+
+# Labels of the choices by path
+CHOICES = {
+	("updateChannel",): addoncfg.updateChannels,
+	("speakScroll",): addoncfg.focusOrReviewChoices,
+	("volumeChangeFeedback",): addoncfg.outputMessage,
+	("modifierKeysFeedback",): addoncfg.outputMessage,
+	("attributes",): addoncfg.attributeChoices,
+	("oneHandedMode", "inputMethod"): INPUT_METHODS,
+}
+
+_model = None
+_modelDisplay = None
+
+
+class Option:
+	"""An option of the add-on which can be changed step by step."""
+
+	def __init__(self, path, kind, values=None, minimum=None, maximum=None):
+		self.path = path
+		self.kind = kind
+		self.values = values
+		self.minimum = minimum
+		self.maximum = maximum
+		if kind == "integer": self.step = INTEGER_STEPS.get(self.key, 1)
+
+	@property
+	def key(self):
+		"""The path of the option, without the suffix of the braille display."""
+		suffix = "_%s" % addoncfg.curBD
+		if not self.path[-1].endswith(suffix): return self.path
+		return self.path[:-1] + (self.path[-1][:-len(suffix)],)
+
+	@property
+	def label(self):
+		return LABELS.get(self.key, " > ".join(self.key))
+
+	def getValue(self):
+		section = config.conf["brailleExtender"]
+		for key in self.path[:-1]: section = section[key]
+		return section[self.path[-1]]
+
+	def change(self, value, direction):
+		"""Returns the value after `value` in `direction` (1 or -1)."""
+		if self.kind == "boolean": return not value
+		if self.kind == "integer":
+			return min(self.maximum, max(self.minimum, value + self.step * direction))
+		i = self.values.index(value) if value in self.values else 0
+		return self.values[(i + direction) % len(self.values)]
+
+	def format(self, value):
+		if self.kind == "boolean": value = _("on") if value else _("off")
+		elif self.kind == "option":
+			choices = CHOICES.get(self.key) or CHOICES.get(self.key[:-1], {})
+			value = choices.get(value, value)
+		return "%s: %s" % (self.label, value)
+
+
+def parseSpec(path, spec):
+	"""Returns the option for a specification string, None if it can't be changed step by step."""
+	match = RE_SPEC.match(spec)
+	if not match: return None
+	kind, args = match.groups()
+	values = []
+	keywords = {}
+	for arg in args.split(','):
+		keyword = RE_KEYWORD.match(arg)
+		if keyword: keywords[keyword.group(1)] = keyword.group(2)
+		elif arg.strip(): values.append(arg.strip().strip("\"'"))
+	if kind == "boolean": return Option(path, kind)
+	if kind == "option" and len(values) > 1: return Option(path, kind, values=values)
+	if kind == "integer" and "min" in keywords and "max" in keywords:
+		try: return Option(path, kind, minimum=int(keywords["min"]), maximum=int(keywords["max"]))
+		except ValueError: return None
+	return None
+
+
+def buildModel(spec, path=()):
+	options = []
+	for key, value in spec.items():
+		if isinstance(value, dict): options += buildModel(value, path + (key,))
+		elif isinstance(value, str):
+			option = parseSpec(path + (key,), value)
+			if option and option.key not in EXCLUDED: options.append(option)
+	return options
+
+
+def getModel():
+	"""Returns the options of the add-on, computed once per braille display."""
+	global _model, _modelDisplay
+	if _model is None or _modelDisplay != addoncfg.curBD:
+		_model = buildModel(addoncfg.getConfspec())
+		_modelDisplay = addoncfg.curBD
+	return _model
+
+
+class VirtualSettings:
+	"""State of the virtual settings mode."""
+
+	def __init__(self):
+		self.options = getModel()
+		self.index = 0
+		self.changes = {}
+		self._lines = {}
+
+	@property
+	def option(self):
+		return self.options[self.index]
+
+	def getValue(self, option):
+		if option.path in self.changes: return self.changes[option.path]
+		return option.getValue()
+
+	def getLine(self):
+		"""Returns the text of the current option, rendered again only when it changed."""
+		line = self._lines.get(self.index)
+		if line is None: line = self._lines[self.index] = self.option.format(self.getValue(self.option))
+		return line
+
+	def move(self, direction):
+		self.index = (self.index + direction) % len(self.options)
+		return self.getLine()
+
+	def change(self, direction):
+		option = self.option
+		value = option.change(self.getValue(option), direction)
+		if value == option.getValue(): self.changes.pop(option.path, None)
+		else: self.changes[option.path] = value
+		self._lines.pop(self.index, None)
+		return self.getLine()
+
+	def save(self):
+		"""Writes all the changes to the configuration. Returns the paths of the changed options, without the suffix of the braille display."""
+		for path, value in self.changes.items():
+			section = config.conf["brailleExtender"]
+			for key in path[:-1]: section = section[key]
+			section[path[-1]] = value
+		keys = [option.key for option in self.options if option.path in self.changes]
+		self.changes = {}
+		return keys